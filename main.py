@@ -2,20 +2,22 @@ import os
 import logging
 import random
 import re
+import time
 import asyncio
+import threading
 import json
+from contextlib import contextmanager, suppress
 from datetime import datetime, timezone
-from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
+from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup, LinkPreviewOptions
 from telegram.ext import (
+    AIORateLimiter,
     ApplicationBuilder,
     CommandHandler,
-    MessageHandler,
     CallbackQueryHandler,
     ContextTypes,
-    filters,
 )
-from openai import OpenAI
-import traceback
+from openai import AsyncOpenAI, NotFoundError
+import httpx
 
 # Import scheduled_posts_runner to run both bot and scheduler in same process
 try:
@@ -34,9 +36,22 @@ try:
 except Exception:
     SUPABASE_AVAILABLE = False
 
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
+
+try:
+    import uvloop
+    UVLOOP_AVAILABLE = True
+except ImportError:
+    UVLOOP_AVAILABLE = False
+
 try:
     import psycopg2
     import psycopg2.extras
+    import psycopg2.pool
     PSYCOPG2_AVAILABLE = True
 except Exception:
     PSYCOPG2_AVAILABLE = False
@@ -62,82 +77,140 @@ SUPABASE_ANON_KEY = os.getenv("SUPABASE_ANON_KEY", "")
 
 # Runtime vars
 USE_MODE = None  # "pg", "rest_service", "rest_anon", or None
-pg_conn = None
+pg_pool = None
+# Postgres connections shared by the handler threads; keep DB_POOL_MAX within
+# the Supabase pooler's per-client limit
+DB_POOL_MIN = int(os.getenv("DB_POOL_MIN", "1"))
+DB_POOL_MAX = int(os.getenv("DB_POOL_MAX", "10"))
+# ThreadedConnectionPool raises instead of waiting when empty; make callers wait
+_pg_slots = threading.BoundedSemaphore(DB_POOL_MAX)
 supabase = None
 
-# Initialize OpenAI client as before (only used in /ask)
-openai_client = OpenAI(api_key=OPENAI_API_KEY) if OPENAI_API_KEY else None
+# Initialize OpenAI client as before (only used in /ask). Async so a slow
+# completion doesn't block the event loop for every other user.
+# One long-lived HTTP/2 transport so /ask reuses the TLS connection between calls.
+openai_http = httpx.AsyncClient(
+    http2=True,
+    timeout=httpx.Timeout(30.0, connect=5.0),
+    limits=httpx.Limits(max_keepalive_connections=20, max_connections=64),
+)
+# The SDK already retries 429s and connection errors with exponential backoff and
+# honours Retry-After; the semaphore bounds how many completions are in flight.
+OPENAI_MAX_RETRIES = int(os.getenv("OPENAI_MAX_RETRIES", "4"))
+openai_client = AsyncOpenAI(
+    api_key=OPENAI_API_KEY, http_client=openai_http, max_retries=OPENAI_MAX_RETRIES
+) if OPENAI_API_KEY else None
+OPENAI_MODEL = "gpt-4o-mini"
+_openai_sem = asyncio.Semaphore(int(os.getenv("OPENAI_CONCURRENCY", "8")))
+
+# Telegram bot HTTP connection pool size (outgoing replies/edits)
+TG_POOL_SIZE = int(os.getenv("TG_POOL_SIZE", "512"))
+
+# How often the keep-warm job touches Supabase/OpenAI (seconds)
+KEEP_WARM_INTERVAL = int(os.getenv("KEEP_WARM_INTERVAL", "240"))
+# Public HTTPS base URL for webhook mode; leave unset to keep long polling
+WEBHOOK_URL = os.getenv("WEBHOOK_URL", "").rstrip("/")
+PORT = int(os.getenv("PORT", "8443"))
+# Sent by Telegram in X-Telegram-Bot-Api-Secret-Token; PTB rejects webhook calls without it
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET") or None
+
+def pool_supabase_http(client):
+    """Replace postgrest's default httpx session with a pooled keep-alive HTTP/2
+    one (same base URL and auth headers), so repeated .execute() calls reuse
+    the TLS connection instead of reconnecting. The pool is capped well under
+    Supabase's pooler connection limit."""
+    try:
+        rest = client.postgrest
+        old = rest.session
+        rest.session = httpx.Client(
+            base_url=old.base_url,
+            headers=old.headers,
+            timeout=httpx.Timeout(10.0, connect=2.0),
+            http2=True,
+            limits=httpx.Limits(max_connections=20, max_keepalive_connections=10, keepalive_expiry=60),
+        )
+        old.close()
+    except Exception as e:
+        logger.warning(f"Could not configure Supabase connection pool, using defaults: {e}")
 
 def init_db_clients():
-    global pg_conn, supabase, USE_MODE
-
-    # DEBUG: Print what we have available
-    print("=" * 60)
-    print("DATABASE CONNECTION DIAGNOSTIC")
-    print("=" * 60)
-    print(f"SUPABASE_DB_URL: {'SET' if SUPABASE_DB_URL else 'NOT SET'}")
-    print(f"SUPABASE_URL: {'SET' if SUPABASE_URL else 'NOT SET'}")
-    print(f"SUPABASE_SERVICE_ROLE_KEY: {'SET' if SUPABASE_SERVICE_ROLE_KEY else 'NOT SET'}")
-    print(f"SUPABASE_ANON_KEY: {'SET' if SUPABASE_ANON_KEY else 'NOT SET'}")
-    print(f"PSYCOPG2_AVAILABLE: {PSYCOPG2_AVAILABLE}")
-    print(f"SUPABASE_AVAILABLE: {SUPABASE_AVAILABLE}")
-    print("=" * 60)
+    global pg_pool, supabase, USE_MODE
+
+    logger.info("DB diagnostics: %s", json.dumps({
+        "SUPABASE_DB_URL": bool(SUPABASE_DB_URL),
+        "SUPABASE_URL": bool(SUPABASE_URL),
+        "SUPABASE_SERVICE_ROLE_KEY": bool(SUPABASE_SERVICE_ROLE_KEY),
+        "SUPABASE_ANON_KEY": bool(SUPABASE_ANON_KEY),
+        "PSYCOPG2_AVAILABLE": PSYCOPG2_AVAILABLE,
+        "SUPABASE_AVAILABLE": SUPABASE_AVAILABLE,
+    }))
 
     # Prefer direct Postgres if DSN provided and psycopg2 available
     if SUPABASE_DB_URL and PSYCOPG2_AVAILABLE:
-        print("Attempting Direct Postgres connection...")
+        logger.debug("Attempting Direct Postgres connection...")
         try:
-            pg_conn = psycopg2.connect(SUPABASE_DB_URL, cursor_factory=psycopg2.extras.RealDictCursor)
-            pg_conn.autocommit = False
+            pg_pool = psycopg2.pool.ThreadedConnectionPool(
+                DB_POOL_MIN, DB_POOL_MAX, SUPABASE_DB_URL, cursor_factory=psycopg2.extras.RealDictCursor
+            )
             USE_MODE = "pg"
             logger.info("DB mode: direct Postgres (SUPABASE_DB_URL).")
-            print("✅ SUCCESS: Connected via Direct Postgres")
             return
         except Exception as e:
             logger.error(f"Failed to connect with SUPABASE_DB_URL: {e}")
-            print(f"❌ FAILED: Direct Postgres - {e}")
 
     # Try service role REST API first (bypasses RLS)
     if SUPABASE_URL and SUPABASE_SERVICE_ROLE_KEY and SUPABASE_AVAILABLE:
-        print("Attempting Supabase REST API with SERVICE_ROLE_KEY...")
+        logger.debug("Attempting Supabase REST API with SERVICE_ROLE_KEY...")
         try:
             # Python supabase-py automatically handles headers for SERVICE_ROLE_KEY
             supabase = create_client(SUPABASE_URL, SUPABASE_SERVICE_ROLE_KEY)
+            pool_supabase_http(supabase)
             USE_MODE = "rest_service"
             logger.info("DB mode: Supabase REST service role (SUPABASE_URL + SUPABASE_SERVICE_ROLE_KEY).")
-            print("✅ SUCCESS: Connected via Supabase REST API (SERVICE ROLE)")
             return
         except Exception as e:
             logger.error(f"Failed to init supabase REST service role client: {e}")
-            print(f"❌ FAILED: Supabase REST API (SERVICE ROLE) - {e}")
 
     # Fallback to anon REST if available
     if SUPABASE_URL and SUPABASE_ANON_KEY and SUPABASE_AVAILABLE:
-        print("Attempting Supabase REST API with ANON_KEY...")
+        logger.debug("Attempting Supabase REST API with ANON_KEY...")
         try:
             # Python supabase-py automatically handles headers for ANON_KEY
             supabase = create_client(SUPABASE_URL, SUPABASE_ANON_KEY)
+            pool_supabase_http(supabase)
             USE_MODE = "rest_anon"
             logger.info("DB mode: Supabase REST anon (SUPABASE_URL + SUPABASE_ANON_KEY).")
-            print("✅ SUCCESS: Connected via Supabase REST API (ANON)")
             return
         except Exception as e:
             logger.error(f"Failed to init supabase REST anon client: {e}")
-            print(f"❌ FAILED: Supabase REST API (ANON) - {e}")
 
     USE_MODE = None
     logger.warning("No DB client configured: set SUPABASE_DB_URL or SUPABASE_URL + SUPABASE_SERVICE_ROLE_KEY/SUPABASE_ANON_KEY.")
-    print("❌ RESULT: No DB client configured")
-    print("=" * 60)
 
 # Run initialization once
 init_db_clients()
 
 # ------- DB helper wrappers -------
-def run_pg_query(query, params=None, fetchone=False, fetchall=True):
-    if pg_conn is None:
+@contextmanager
+def pg_connection():
+    """Borrow a pooled connection; commit on success, roll back on error."""
+    if pg_pool is None:
         raise RuntimeError("Postgres connection not initialized.")
-    with pg_conn.cursor() as cur:
+    with _pg_slots:
+        conn = pg_pool.getconn()
+        try:
+            yield conn
+            conn.commit()
+        except Exception:
+            if not conn.closed:
+                conn.rollback()
+            raise
+        finally:
+            # A connection the server dropped is discarded rather than handed out again
+            pg_pool.putconn(conn, close=bool(conn.closed))
+
+def run_pg_query(query, params=None, fetchone=False, fetchall=True):
+    with pg_connection() as conn, conn.cursor() as cur:
         cur.execute(query, params or ())
         if fetchone:
             return cur.fetchone()
@@ -145,7 +218,15 @@ def run_pg_query(query, params=None, fetchone=False, fetchall=True):
             return cur.fetchall()
         return None
 
-def supabase_select(table, select_clause="*", eq=None, ilike=None, limit=None):
+def run_pg_scalar(query, params=None):
+    """First column of the first row (or None), read with a plain tuple cursor
+    so single-value lookups skip building a RealDictRow."""
+    with pg_connection() as conn, conn.cursor(cursor_factory=psycopg2.extensions.cursor) as cur:
+        cur.execute(query, params or ())
+        row = cur.fetchone()
+        return row[0] if row else None
+
+def supabase_select(table, select_clause="*", eq=None, ilike=None, order=None, limit=None, single=False):
     if supabase is None:
         raise RuntimeError("Supabase client not initialized.")
     q = supabase.table(table).select(select_clause)
@@ -153,47 +234,166 @@ def supabase_select(table, select_clause="*", eq=None, ilike=None, limit=None):
         q = q.eq(eq[0], eq[1])
     if ilike is not None:
         q = q.ilike(ilike[0], ilike[1])
+    if order is not None:
+        q = q.order(order)
     if limit:
         q = q.limit(limit)
-    return q.execute()
+    if single:
+        # PostgREST answers with one JSON object (or nothing) instead of an array
+        q = q.maybe_single()
+    return execute_rest(q)
+
+def execute_rest(q):
+    # A pooled keep-alive socket can be closed server-side while idle; retry once on a fresh one
+    try:
+        return q.execute()
+    except (httpx.RemoteProtocolError, httpx.ReadError) as e:
+        logger.warning(f"Supabase connection dropped, retrying once: {e}")
+        return q.execute()
 
 # ------- Synchronous DB functions used by handlers (called via executor) -------
-def has_greeted_sync(user_id):
+# Once greeted, always greeted: remember known users so repeat /start skips the DB.
+_greeted = set()
+_greeted_primed = False  # True once prime_greeted_sync loaded the whole table
+
+# With the table primed, a user missing from _greeted is new, so the insert is
+# only queued; flush_greeted_sync writes the queue in one statement (JobQueue
+# every GREET_FLUSH_INTERVAL s, on a full queue, and at shutdown).
+GREET_FLUSH_INTERVAL = int(os.getenv("GREET_FLUSH_INTERVAL", "5"))
+GREET_FLUSH_MAX = int(os.getenv("GREET_FLUSH_MAX", "100"))
+_pending_greets = set()
+_pending_greets_lock = threading.Lock()
+
+def claim_greeting_sync(user_id):
+    """Record user_id as greeted; True if they hadn't been greeted before.
+    Without a primed set, one ON CONFLICT DO NOTHING insert both checks and
+    marks, and it only runs for users not already in _greeted."""
+    if user_id in _greeted:
+        return False
+    if _greeted_primed:
+        with _pending_greets_lock:
+            if user_id in _greeted:
+                return False
+            _greeted.add(user_id)
+            _pending_greets.add(user_id)
+            full = len(_pending_greets) >= GREET_FLUSH_MAX
+        if full:
+            flush_greeted_sync()
+        return True
     try:
         if USE_MODE == "pg":
-            row = run_pg_query("SELECT user_id FROM public.greeted_users WHERE user_id = %s LIMIT 1", (user_id,), fetchone=True)
-            return bool(row)
+            inserted = run_pg_scalar(
+                "INSERT INTO public.greeted_users (user_id) VALUES (%s) ON CONFLICT (user_id) DO NOTHING RETURNING user_id",
+                (user_id,),
+            ) is not None
         elif USE_MODE in ("rest_anon", "rest_service"):
-            res = supabase_select("greeted_users", select_clause="user_id", eq=("user_id", user_id), limit=1)
-            return bool(getattr(res, "data", None))
+            # With ignore_duplicates PostgREST returns only the rows it actually inserted
+            res = execute_rest(supabase.table("greeted_users").upsert(
+                {"user_id": user_id}, on_conflict="user_id", ignore_duplicates=True
+            ))
+            inserted = bool(getattr(res, "data", None))
+        else:
+            return True
     except Exception as e:
-        logger.error(f"has_greeted_sync error: {e}")
-    return False
+        logger.error(f"claim_greeting_sync error: {e}")
+        # Better to welcome someone twice than never; retry the insert next time
+        return True
+    _greeted.add(user_id)
+    return inserted
 
-def mark_greeted_sync(user_id):
+def prime_greeted_sync():
+    """Load every greeted user id once at startup, so returning users' first
+    /start after a restart is answered from _greeted too."""
+    global _greeted_primed
     try:
         if USE_MODE == "pg":
-            run_pg_query("INSERT INTO public.greeted_users (user_id) VALUES (%s) ON CONFLICT (user_id) DO NOTHING", (user_id,), fetchall=False)
-            pg_conn.commit()
+            rows = run_pg_query("SELECT user_id FROM public.greeted_users")
+            _greeted.update(r["user_id"] for r in rows)
         elif USE_MODE in ("rest_anon", "rest_service"):
-            supabase.table("greeted_users").insert({"user_id": user_id}).execute()
+            # PostgREST caps each response (1000 rows by default); page through in
+            # user_id order, since unordered pages can skip or repeat rows
+            page = 1000
+            start = 0
+            while True:
+                res = execute_rest(supabase.table("greeted_users").select("user_id").order("user_id").range(start, start + page - 1))
+                rows = getattr(res, "data", None) or []
+                _greeted.update(r["user_id"] for r in rows)
+                if len(rows) < page:
+                    break
+                start += page
     except Exception as e:
-        logger.error(f"mark_greeted_sync error: {e}")
+        logger.error(f"prime_greeted_sync error: {e}")
+        return
+    _greeted_primed = USE_MODE is not None
+
+# Errors worth retrying a greeting flush for: the DB or network was unreachable.
+# Anything else (constraint, permission, bad SQL) would fail the same way forever.
+TRANSIENT_DB_ERRORS = (httpx.TransportError,)
+if PSYCOPG2_AVAILABLE:
+    TRANSIENT_DB_ERRORS += (psycopg2.OperationalError, psycopg2.InterfaceError, psycopg2.pool.PoolError)
+
+def flush_greeted_sync():
+    with _pending_greets_lock:
+        batch = list(_pending_greets)
+        _pending_greets.clear()
+    if not batch or USE_MODE is None:
+        return
+    try:
         if USE_MODE == "pg":
-            try:
-                pg_conn.rollback()
-            except:
-                pass
+            run_pg_query("INSERT INTO public.greeted_users (user_id) SELECT unnest(%s::bigint[]) ON CONFLICT (user_id) DO NOTHING", (batch,), fetchall=False)
+        elif USE_MODE in ("rest_anon", "rest_service"):
+            # upsert+ignore_duplicates is REST's ON CONFLICT DO NOTHING; a plain
+            # insert would reject the whole batch over one already-known user
+            execute_rest(supabase.table("greeted_users").upsert(
+                [{"user_id": u} for u in batch], on_conflict="user_id", ignore_duplicates=True
+            ))
+    except TRANSIENT_DB_ERRORS as e:
+        logger.warning(f"flush_greeted_sync failed, retrying {len(batch)} user(s) next flush: {e}")
+        # Keep them for the next flush
+        with _pending_greets_lock:
+            _pending_greets.update(batch)
+    except Exception as e:
+        # They stay in _greeted, so this process won't welcome them twice either way
+        logger.error(f"flush_greeted_sync error, dropping {len(batch)} user(s): {e}")
+
+async def flush_greeted(context: ContextTypes.DEFAULT_TYPE):
+    await asyncio.to_thread(flush_greeted_sync)
+
+# search_faq() comes from migrations/001_faq_search.sql. If the function doesn't
+# exist (migration not applied) we stop trying and use the plain ILIKE query;
+# other errors (timeouts, dropped connections) only fall back for that call.
+_faq_search_rpc = True
+# PostgREST / Postgres error codes for a function that doesn't exist
+MISSING_FUNCTION_CODES = frozenset({"PGRST202", "42883"})
+
+def db_error_code(e):
+    """SQLSTATE of a psycopg2 error or code of a postgrest APIError, else None"""
+    return getattr(e, "pgcode", None) or getattr(e, "code", None)
+
+def search_faq_sync(user_question):
+    if USE_MODE == "pg":
+        return run_pg_scalar("SELECT public.search_faq(%s)", (user_question,))
+    res = execute_rest(supabase.rpc("search_faq", {"q": user_question}))
+    return getattr(res, "data", None) or None
 
 def get_faq_answer_sync(user_question):
+    global _faq_search_rpc
+    if _faq_search_rpc and USE_MODE is not None:
+        try:
+            return search_faq_sync(user_question)
+        except Exception as e:
+            if db_error_code(e) in MISSING_FUNCTION_CODES:
+                logger.warning(f"search_faq RPC unavailable, falling back to ILIKE: {e}")
+                _faq_search_rpc = False
+            else:
+                logger.warning(f"search_faq RPC failed, using ILIKE for this question: {e}")
     try:
         if USE_MODE == "pg":
-            row = run_pg_query("SELECT answer FROM public.faq WHERE question ILIKE %s LIMIT 1", (f"%{user_question}%",), fetchone=True)
-            return row["answer"] if row else None
+            return run_pg_scalar("SELECT answer FROM public.faq WHERE question ILIKE %s LIMIT 1", (f"%{user_question}%",))
         elif USE_MODE in ("rest_anon", "rest_service"):
-            res = supabase_select("faq", select_clause="answer", ilike=("question", f"%{user_question}%"), limit=1)
+            res = supabase_select("faq", select_clause="answer", ilike=("question", f"%{user_question}%"), limit=1, single=True)
             if getattr(res, "data", None):
-                return res.data[0].get("answer")
+                return res.data.get("answer")
     except Exception as e:
         logger.error(f"get_faq_answer_sync error: {e}")
     return None
@@ -201,10 +401,11 @@ def get_faq_answer_sync(user_question):
 def fetch_faq_list_sync():
     try:
         if USE_MODE == "pg":
-            rows = run_pg_query("SELECT id, question FROM public.faq ORDER BY id")
+            rows = run_pg_query("SELECT id, question, answer FROM public.faq ORDER BY id")
             return rows or []
         elif USE_MODE in ("rest_anon", "rest_service"):
-            res = supabase_select("faq", select_clause="id,question")
+            # Same order as the pg branch: the prompt prefix and /faq keyboard stay stable
+            res = supabase_select("faq", select_clause="id,question,answer", order="id")
             return res.data or []
     except Exception as e:
         logger.error(f"fetch_faq_list_sync error: {e}")
@@ -213,11 +414,10 @@ def fetch_faq_list_sync():
 def fetch_faq_answer_by_id_sync(faq_id):
     try:
         if USE_MODE == "pg":
-            row = run_pg_query("SELECT answer FROM public.faq WHERE id = %s LIMIT 1", (faq_id,), fetchone=True)
-            return row["answer"] if row else None
+            return run_pg_scalar("SELECT answer FROM public.faq WHERE id = %s LIMIT 1", (faq_id,))
         elif USE_MODE in ("rest_anon", "rest_service"):
-            res = supabase_select("faq", select_clause="answer", eq=("id", faq_id), limit=1)
-            return res.data[0]["answer"] if getattr(res, "data", None) else None
+            res = supabase_select("faq", select_clause="answer", eq=("id", faq_id), limit=1, single=True)
+            return res.data["answer"] if getattr(res, "data", None) else None
     except Exception as e:
         logger.error(f"fetch_faq_answer_by_id_sync error: {e}")
     return None
@@ -225,7 +425,7 @@ def fetch_faq_answer_by_id_sync(faq_id):
 def fetch_facts_list_sync():
     try:
         if USE_MODE == "pg":
-            rows = run_pg_query("SELECT fact FROM public.fact ORDER BY id")
+            rows = run_pg_query("SELECT fact FROM public.fact")
             return [r["fact"] for r in (rows or [])]
         elif USE_MODE in ("rest_anon", "rest_service"):
             res = supabase_select("fact", select_clause="fact")
@@ -240,12 +440,170 @@ def fetch_resources_list_sync():
             rows = run_pg_query("SELECT title, link FROM public.resources ORDER BY id")
             return rows or []
         elif USE_MODE in ("rest_anon", "rest_service"):
-            res = supabase_select("resources", select_clause="title,link")
+            res = supabase_select("resources", select_clause="title,link", order="id")
             return res.data or []
     except Exception as e:
         logger.error(f"fetch_resources_list_sync error: {e}")
     return []
 
+# ------- In-process TTL caches for the read-mostly tables -------
+# FAQ and fact rows change rarely, so handlers read them from memory and only
+# go to the DB once per CACHE_TTL. A failed or empty refresh keeps the stale rows.
+CACHE_TTL = int(os.getenv("CACHE_TTL", "300"))
+_faq_cache = {"ts": 0.0, "rows": [], "by_id": {}, "by_question": {}, "prompt": None, "markup": None}
+_NON_WORD_RE = re.compile(r'\W+')
+
+def normalize_question(text):
+    return _NON_WORD_RE.sub(' ', text.lower()).strip()
+_facts_cache = {"ts": 0.0, "facts": []}
+# One refresh per cache at a time: when a cache expires under a burst, one worker
+# thread reloads it while the others keep serving the stale copy.
+_faq_lock = threading.Lock()
+_facts_lock = threading.Lock()
+_resources_lock = threading.Lock()
+
+@contextmanager
+def single_refresh(lock, have_stale):
+    """Yield True in the thread that should refresh. Others get False straight
+    away if there is stale data to serve, or wait for the refresher if not."""
+    acquired = lock.acquire(blocking=not have_stale)
+    try:
+        yield acquired
+    finally:
+        if acquired:
+            lock.release()
+
+def _expired(cache, key, ttl):
+    return not cache[key] or time.monotonic() - cache["ts"] >= ttl
+
+def get_faq_list(force=False):
+    if not (force or _expired(_faq_cache, "rows", CACHE_TTL)):
+        return _faq_cache["rows"]
+    with single_refresh(_faq_lock, bool(_faq_cache["rows"])) as refresher:
+        # A thread that waited may find the rows were loaded meanwhile
+        if refresher and (force or _expired(_faq_cache, "rows", CACHE_TTL)):
+            rows = fetch_faq_list_sync()
+            if rows:
+                _faq_cache.update(
+                    ts=time.monotonic(),
+                    rows=rows,
+                    by_id={str(r["id"]): r["answer"] for r in rows},
+                    by_question={normalize_question(r["question"]): r["answer"] for r in rows},
+                    prompt=build_system_prompt(rows),
+                    markup=build_faq_markup(rows),
+                )
+    return _faq_cache["rows"]
+
+def build_faq_markup(faq_rows):
+    # Markups are immutable once built, so one instance is shared by every /faq reply
+    keyboard = [[InlineKeyboardButton(q["question"], callback_data=f'faq_{q["id"]}')] for q in faq_rows]
+    return InlineKeyboardMarkup(keyboard)
+
+def get_faq_markup():
+    get_faq_list()
+    return _faq_cache["markup"]
+
+def get_faq_answer_by_id(faq_id):
+    get_faq_list()
+    answer = _faq_cache["by_id"].get(str(faq_id))
+    if answer is None:
+        # Button from a keyboard sent before the last refresh; ask the DB directly
+        answer = fetch_faq_answer_by_id_sync(faq_id)
+    return answer
+
+def find_faq_answer(user_question):
+    """/ask FAQ lookup: a question typed exactly as listed (ignoring case and
+    punctuation) is answered from the cache; anything else goes to the DB."""
+    get_faq_list()
+    answer = _faq_cache["by_question"].get(normalize_question(user_question))
+    if answer is not None:
+        return answer
+    return get_faq_answer_sync(user_question)
+
+def get_facts(force=False):
+    if not (force or _expired(_facts_cache, "facts", CACHE_TTL)):
+        return _facts_cache["facts"]
+    with single_refresh(_facts_lock, bool(_facts_cache["facts"])) as refresher:
+        if refresher and (force or _expired(_facts_cache, "facts", CACHE_TTL)):
+            facts = fetch_facts_list_sync()
+            if facts:
+                _facts_cache.update(ts=time.monotonic(), facts=facts)
+    return _facts_cache["facts"]
+
+# /resources rarely changes either; cache the rendered Markdown body itself
+RESOURCES_TTL = int(os.getenv("RESOURCES_TTL", "600"))
+_resources_cache = {"ts": 0.0, "msg": None}
+
+def get_resources_msg(force=False):
+    if not (force or _expired(_resources_cache, "msg", RESOURCES_TTL)):
+        return _resources_cache["msg"]
+    with single_refresh(_resources_lock, _resources_cache["msg"] is not None) as refresher:
+        if refresher and (force or _expired(_resources_cache, "msg", RESOURCES_TTL)):
+            rows = fetch_resources_list_sync()
+            if rows:
+                msg_lines = [f"[{item['title']}]({item['link']})" for item in rows]
+                _resources_cache.update(ts=time.monotonic(), msg="Here are some resources:\n" + "\n".join(msg_lines))
+    return _resources_cache["msg"]
+
+def refresh_caches_sync():
+    if USE_MODE is not None:
+        get_faq_list(force=True)
+        get_facts(force=True)
+        get_resources_msg(force=True)
+
+async def warm_caches(application):
+    """post_init hook: fill the caches before the first update is handled so
+    the first /faq, /fact and /resources don't each pay for a DB round trip."""
+    if USE_MODE is None:
+        return
+    await asyncio.gather(
+        asyncio.to_thread(get_faq_list, True),
+        asyncio.to_thread(get_facts, True),
+        asyncio.to_thread(get_resources_msg, True),
+        asyncio.to_thread(prime_greeted_sync),
+    )
+    logger.info(f"Caches warmed: {len(_faq_cache['rows'])} FAQs, {len(_facts_cache['facts'])} facts, {len(_greeted)} greeted users")
+
+_scheduler_task = None
+
+async def on_startup(application):
+    """post_init hook: warm the caches and start the scheduled-posts loop as a
+    task on the bot's event loop (it only needs a thread while jobs run)."""
+    global _scheduler_task
+    await warm_caches(application)
+    if openai_client:
+        await recover_ask_later()
+    if SCHEDULER_AVAILABLE and scheduled_posts_runner:
+        logger.info("🚀 Starting scheduled_posts_runner on the bot event loop...")
+        _scheduler_task = asyncio.create_task(scheduled_posts_runner.scheduler_task())
+
+async def keep_warm(context: ContextTypes.DEFAULT_TYPE):
+    """Reload the FAQ/fact caches and make a free OpenAI call so pooled
+    connections are still open when the next user arrives after idle."""
+    await asyncio.to_thread(refresh_caches_sync)
+    if openai_client:
+        try:
+            await openai_client.models.retrieve(OPENAI_MODEL)
+        except Exception as e:
+            logger.warning(f"OpenAI keep-warm failed: {e}")
+
+async def on_shutdown(application):
+    """post_shutdown hook: write queued greetings and submit queued /asklater
+    questions, then close the long-lived HTTP and DB pools cleanly."""
+    if _scheduler_task is not None:
+        _scheduler_task.cancel()
+        # Wait for it to unwind before the pools it may still be using are closed
+        with suppress(asyncio.CancelledError):
+            await _scheduler_task
+    await asyncio.to_thread(flush_greeted_sync)
+    # Submit queued /asklater questions so the next process can recover them
+    await submit_ask_later(None)
+    await openai_http.aclose()
+    if supabase is not None:
+        await asyncio.to_thread(supabase.postgrest.session.close)
+    if pg_pool is not None:
+        await asyncio.to_thread(pg_pool.closeall)
+
 # ------- Bot logic / handlers -------
 processing_messages = [
     "Hey Champ, give me a second to help you with that!",
@@ -271,85 +629,345 @@ WELCOME = (
 
 RULES_LINK = "https://t.me/c/2377255109/6/400"
 
+_ERR_FETCH = "Sorry, Champ! Aurion can't fetch this right now due to technical issues."
+_ERR_NO_DB = "Database not configured. Admins: check SUPABASE env vars."
+
+# Static link lists don't need Telegram to fetch a preview for the first URL
+NO_PREVIEW = LinkPreviewOptions(is_disabled=True)
+
+_SIGNOFF_RE = re.compile(r'[\s.]*' + re.escape(SIGNOFF) + r'[\s.]*$')
+_SENTENCE_END = ('.', '!', '?')
+
 def ensure_signoff_once(answer, signoff):
-    pattern = r'[\s.]*' + re.escape(signoff) + r'[\s.]*$'
-    answer = re.sub(pattern, '', answer.strip())
-    if not answer.endswith(('.', '!', '?')):
+    answer = answer.strip()
+    # Most answers don't contain the signoff at all; only run the regex when they do
+    if signoff in answer:
+        if signoff == SIGNOFF:
+            answer = _SIGNOFF_RE.sub('', answer)
+        else:
+            answer = re.sub(r'[\s.]*' + re.escape(signoff) + r'[\s.]*$', '', answer)
+    if not answer.endswith(_SENTENCE_END):
         answer += '.'
     return answer + ' ' + signoff
 
 # Handlers use executor to call sync DB functions
 async def faq(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if USE_MODE is None:
-        await update.message.reply_text("Database not configured. Admins: check SUPABASE env vars.")
+        await update.message.reply_text(_ERR_NO_DB)
         return
-    loop = asyncio.get_event_loop()
     try:
-        faqs = await loop.run_in_executor(None, fetch_faq_list_sync)
-    except Exception as e:
-        logger.error(f"Error fetching FAQ list: {e}")
-        faqs = []
-    if not faqs:
-        await update.message.reply_text("Sorry, Champ! Aurion can't fetch this right now due to technical issues.")
+        reply_markup = await asyncio.to_thread(get_faq_markup)
+    except Exception:
+        logger.exception("Error fetching FAQ list")
+        reply_markup = None
+    if reply_markup is None:
+        await update.message.reply_text(_ERR_FETCH)
         return
-    keyboard = [[InlineKeyboardButton(q["question"], callback_data=f'faq_{q["id"]}')] for q in faqs]
-    reply_markup = InlineKeyboardMarkup(keyboard)
     await update.message.reply_text("Select a FAQ:", reply_markup=reply_markup)
 
 async def faq_button(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if USE_MODE is None:
-        await update.callback_query.edit_message_text("Database not configured. Admins: check SUPABASE env vars.")
+        await update.callback_query.edit_message_text(_ERR_NO_DB)
         return
     query = update.callback_query
     await query.answer()
-    faq_id = query.data.replace('faq_', '')
-    loop = asyncio.get_event_loop()
-    try:
-        answer = await loop.run_in_executor(None, fetch_faq_answer_by_id_sync, faq_id)
-    except Exception as e:
-        logger.error(f"Error fetching FAQ answer by id: {e}")
-        answer = None
+    faq_id = query.data[len('faq_'):]
+    # Cache hit is a dict lookup; only a miss or an expired cache needs the worker thread
+    answer = _faq_cache["by_id"].get(faq_id)
+    if answer is None:
+        try:
+            answer = await asyncio.to_thread(get_faq_answer_by_id, faq_id)
+        except Exception:
+            logger.exception("Error fetching FAQ answer by id")
     await query.edit_message_text(answer or "No answer found.")
 
 async def fact(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if USE_MODE is None:
-        await update.message.reply_text("Database not configured. Admins: check SUPABASE env vars.")
+        await update.message.reply_text(_ERR_NO_DB)
         return
-    loop = asyncio.get_event_loop()
     try:
-        facts = await loop.run_in_executor(None, fetch_facts_list_sync)
-    except Exception as e:
-        logger.error(f"Error fetching facts: {e}")
+        facts = await asyncio.to_thread(get_facts)
+    except Exception:
+        logger.exception("Error fetching facts")
         facts = []
     if facts:
         await update.message.reply_text(f"💎 Aurion Fact:\n{random.choice(facts)}")
     else:
-        await update.message.reply_text("Sorry, Champ! Aurion can't fetch this right now due to technical issues.")
+        await update.message.reply_text(_ERR_FETCH)
 
 async def resources(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if USE_MODE is None:
-        await update.message.reply_text("Database not configured. Admins: check SUPABASE env vars.")
+        await update.message.reply_text(_ERR_NO_DB)
+        return
+    try:
+        resources_msg = await asyncio.to_thread(get_resources_msg)
+    except Exception:
+        logger.exception("Error fetching resources")
+        resources_msg = None
+    if not resources_msg:
+        await update.message.reply_text(_ERR_FETCH)
+        return
+    await update.message.reply_text(resources_msg, parse_mode="Markdown", link_preview_options=NO_PREVIEW)
+
+# ------- OpenAI answers for /ask -------
+SYSTEM_PROMPT = (
+    "You are Aurion, the 3C Mascot: energetic, motivating, a bit cheeky, and always supportive. "
+    "Reply in 1-2 short paragraphs. Vary your phrasing for returning users. "
+    "After your answer, always add this signoff, no line break, just space after the last full stop: "
+    "'Keep crushing it, Champ! Aurion'"
+)
+
+def build_system_prompt(faq_rows):
+    """Persona plus the FAQ corpus as reference. The text only changes when the
+    FAQ rows do, so consecutive /ask calls send a byte-identical prefix that
+    OpenAI's automatic prompt cache can reuse (it needs >= 1024 tokens)."""
+    reference = "\n".join(f"Q: {r['question']}\nA: {r['answer']}" for r in faq_rows)
+    return SYSTEM_PROMPT + "\n\nReference FAQ (use it when it answers the question):\n" + reference
+
+def current_system_prompt():
+    return _faq_cache["prompt"] or SYSTEM_PROMPT
+
+def build_messages(user_question):
+    return [
+        {"role": "system", "content": current_system_prompt()},
+        {"role": "user", "content": user_question}
+    ]
+
+async def generate_answer(user_question):
+    async with _openai_sem:
+        response = await openai_client.chat.completions.create(
+            model=OPENAI_MODEL,
+            messages=build_messages(user_question),
+            max_tokens=300
+        )
+    return response.choices[0].message.content.strip()
+
+# Minimum seconds between edits of a streaming answer. Telegram allows ~1 edit/s
+# in private chats but only 20 messages (edits included) per minute in a group.
+STREAM_EDIT_INTERVAL = float(os.getenv("STREAM_EDIT_INTERVAL", "1.0"))
+STREAM_EDIT_INTERVAL_GROUP = float(os.getenv("STREAM_EDIT_INTERVAL_GROUP", "3.0"))
+
+async def stream_answer(message, user_question):
+    """Stream the completion into a single reply, editing it as text arrives,
+    so the user sees the first words instead of waiting for the whole answer.
+    The OpenAI slot is held only while reading the stream; a separate task does
+    the Telegram edits, so rate-limited edits never block other chats' /ask."""
+    interval = STREAM_EDIT_INTERVAL_GROUP if message.chat_id < 0 else STREAM_EDIT_INTERVAL
+    text = ""
+    shown = ""
+    sent = None
+    done = asyncio.Event()
+
+    async def show_progress():
+        nonlocal shown, sent
+        while not done.is_set():
+            # Telegram strips trailing whitespace and rejects an edit that changes
+            # nothing ("Message is not modified"), e.g. when only "\n\n" arrived
+            current = text
+            if current.strip() and current.rstrip() != shown.rstrip():
+                try:
+                    if sent is None:
+                        sent = await message.reply_text(current)
+                    else:
+                        await sent.edit_text(current)
+                    shown = current
+                except Exception as e:
+                    logger.warning(f"Streaming edit failed, showing the full answer at the end: {e}")
+                    return
+            try:
+                await asyncio.wait_for(done.wait(), interval)
+            except asyncio.TimeoutError:
+                pass
+
+    editor = asyncio.create_task(show_progress())
+    try:
+        async with _openai_sem:
+            stream = await openai_client.chat.completions.create(
+                model=OPENAI_MODEL,
+                messages=build_messages(user_question),
+                max_tokens=300,
+                stream=True
+            )
+            try:
+                async for chunk in stream:
+                    if not chunk.choices or not chunk.choices[0].delta.content:
+                        continue
+                    text += chunk.choices[0].delta.content
+                    if SIGNOFF in text:
+                        # Everything after the signoff gets dropped anyway
+                        break
+            finally:
+                await stream.close()
+    finally:
+        # Let an edit already in flight land first, so the final edit comes last
+        done.set()
+        await editor
+    answer = ensure_signoff_once(text, SIGNOFF)
+    if sent is None:
+        await message.reply_text(answer)
+    elif answer.rstrip() != shown.rstrip():
+        await sent.edit_text(answer)
+    return answer
+
+# Optional micro-batching: questions arriving within ASK_BATCH_WINDOW_MS of each
+# other (up to ASK_BATCH_MAX) share one JSON-mode completion. Off by default since
+# for light traffic the window only adds latency.
+ASK_BATCH_WINDOW_MS = int(os.getenv("ASK_BATCH_WINDOW_MS", "0"))
+ASK_BATCH_MAX = int(os.getenv("ASK_BATCH_MAX", "8"))
+_ask_pending = []  # (question, future) waiting for the next flush
+_ask_flush_handle = None
+
+def parse_batch_answers(text, count):
+    """Answers from a batched completion's {"answers": [...]}, or None unless it
+    holds exactly `count` non-empty strings. The answers come back as separate
+    JSON strings, so a list inside one answer can't leak into another's."""
+    try:
+        data = orjson.loads(text) if ORJSON_AVAILABLE else json.loads(text)
+    except ValueError:
+        return None
+    answers = data.get("answers") if isinstance(data, dict) else None
+    if not isinstance(answers, list) or len(answers) != count:
+        return None
+    if not all(isinstance(a, str) and a.strip() for a in answers):
+        return None
+    return [a.strip() for a in answers]
+
+def _settle(fut, result=None, error=None):
+    # The asker may have been cancelled meanwhile; setting a done future raises
+    if fut.done():
         return
-    loop = asyncio.get_event_loop()
+    if error is not None:
+        fut.set_exception(error)
+    else:
+        fut.set_result(result)
+
+async def _answer_batch(batch):
+    if len(batch) == 1:
+        question, fut = batch[0]
+        try:
+            _settle(fut, await generate_answer(question))
+        except Exception as e:
+            _settle(fut, error=e)
+        return
+    questions = json.dumps([q for q, _ in batch], ensure_ascii=False)
     try:
-        resources_list = await loop.run_in_executor(None, fetch_resources_list_sync)
+        async with _openai_sem:
+            response = await openai_client.chat.completions.create(
+                model=OPENAI_MODEL,
+                messages=[
+                    {"role": "system", "content": current_system_prompt()},
+                    {"role": "user", "content": (
+                        "Answer each question in this JSON array separately, as if it were the only one. "
+                        f'Reply with a JSON object {{"answers": [...]}} holding exactly {len(batch)} strings, '
+                        "the answer to each question in the same order.\n" + questions
+                    )},
+                ],
+                response_format={"type": "json_object"},
+                max_tokens=300 * len(batch)
+            )
     except Exception as e:
-        logger.error(f"Error fetching resources: {e}")
-        resources_list = []
-    if not resources_list:
-        await update.message.reply_text("Sorry, Champ! Aurion can't fetch this right now due to technical issues.")
+        for _, fut in batch:
+            _settle(fut, error=e)
+        return
+    answers = parse_batch_answers(response.choices[0].message.content, len(batch))
+    if answers is None:
+        # Malformed, truncated or miscounted; answer each question on its own
+        logger.warning(f"Batched /ask completion unusable, answering {len(batch)} question(s) individually")
+        answers = [None] * len(batch)
+    for (question, fut), answer in zip(batch, answers):
+        if fut.done():
+            continue
+        if answer is None:
+            try:
+                answer = await generate_answer(question)
+            except Exception as e:
+                _settle(fut, error=e)
+                continue
+        _settle(fut, answer)
+
+# The loop only keeps weak references to tasks; hold running batches here so
+# one can't be garbage-collected mid-flight and leave its askers waiting
+_ask_batch_tasks = set()
+
+def _flush_ask_batch():
+    global _ask_flush_handle
+    if _ask_flush_handle is not None:
+        _ask_flush_handle.cancel()
+        _ask_flush_handle = None
+    batch = _ask_pending[:]
+    _ask_pending.clear()
+    if batch:
+        task = asyncio.get_running_loop().create_task(_answer_batch(batch))
+        _ask_batch_tasks.add(task)
+        task.add_done_callback(_ask_batch_tasks.discard)
+
+async def batched_answer(user_question):
+    global _ask_flush_handle
+    loop = asyncio.get_running_loop()
+    fut = loop.create_future()
+    _ask_pending.append((user_question, fut))
+    if len(_ask_pending) >= ASK_BATCH_MAX:
+        _flush_ask_batch()
+    elif _ask_flush_handle is None:
+        _ask_flush_handle = loop.call_later(ASK_BATCH_WINDOW_MS / 1000, _flush_ask_batch)
+    return await fut
+
+# Identical questions (compared with normalize_question) asked while one is
+# already being answered wait for that completion instead of starting their own,
+# and a finished answer is reused for ANSWER_TTL seconds.
+# Trade-off: everyone asking the same question within ANSWER_TTL gets the same
+# text, despite SYSTEM_PROMPT's "vary your phrasing", in exchange for one
+# completion instead of many. ANSWER_TTL=0 keeps only the in-flight sharing.
+ANSWER_TTL = int(os.getenv("ANSWER_TTL", "300"))
+ANSWER_CACHE_MAX = int(os.getenv("ANSWER_CACHE_MAX", "1024"))
+_answer_cache = {}  # normalized question -> (ts, answer)
+_inflight = {}      # normalized question -> future of the answer being generated
+
+def get_cached_answer(key):
+    hit = _answer_cache.get(key)
+    if hit and time.monotonic() - hit[0] < ANSWER_TTL:
+        return hit[1]
+    return None
+
+def cache_answer(key, answer):
+    if ANSWER_TTL <= 0:
         return
-    msg_lines = [f"[{item['title']}]({item['link']})" for item in resources_list]
-    await update.message.reply_text("Here are some resources:\n" + "\n".join(msg_lines), parse_mode="Markdown")
+    _answer_cache.pop(key, None)
+    if len(_answer_cache) >= ANSWER_CACHE_MAX:
+        # Dicts keep insertion order, so the first key is the oldest
+        del _answer_cache[next(iter(_answer_cache))]
+    _answer_cache[key] = (time.monotonic(), answer)
+
+class AnswerAbandoned(Exception):
+    """The leader of a shared /ask answer was cancelled before finishing"""
+
+async def single_flight(key, coro):
+    fut = asyncio.get_running_loop().create_future()
+    _inflight[key] = fut
+    try:
+        answer = await coro
+    except asyncio.CancelledError:
+        # Not fut.cancel(): followers would get CancelledError and end without a reply
+        fut.set_exception(AnswerAbandoned())
+        fut.exception()
+        raise
+    except Exception as e:
+        fut.set_exception(e)
+        fut.exception()  # mark it retrieved in case nobody else was waiting
+        raise
+    else:
+        fut.set_result(answer)
+        cache_answer(key, answer)
+        return answer
+    finally:
+        del _inflight[key]
 
 # Simple greeting/marking
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     user_id = update.effective_user.id
-    loop = asyncio.get_event_loop()
-    greeted = await loop.run_in_executor(None, has_greeted_sync, user_id)
-    if not greeted:
-        await update.message.reply_text(WELCOME)
-        await loop.run_in_executor(None, mark_greeted_sync, user_id)
+    # Known users are answered straight from the set, without a worker thread
+    if user_id not in _greeted and await asyncio.to_thread(claim_greeting_sync, user_id):
+        await update.message.reply_text(WELCOME, link_preview_options=NO_PREVIEW)
     else:
         await update.message.reply_text(random.choice(processing_messages))
 
@@ -359,42 +977,165 @@ async def ask(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
         await update.message.reply_text("Champ, you gotta ask a question after /ask!")
         return
     user_question = " ".join(context.args)
-    await update.message.reply_text(random.choice(processing_messages))
-    loop = asyncio.get_event_loop()
     try:
-        faq_answer = await loop.run_in_executor(None, get_faq_answer_sync, user_question)
+        # The "working on it" reply and the FAQ lookup are independent; run them together
+        _, faq_answer = await asyncio.gather(
+            update.message.reply_text(random.choice(processing_messages)),
+            asyncio.to_thread(find_faq_answer, user_question),
+        )
         if faq_answer:
             answer = ensure_signoff_once(faq_answer, SIGNOFF)
         else:
             if not openai_client:
                 raise RuntimeError("OpenAI client not configured (OPENAI_API_KEY missing).")
-            system_prompt = (
-                "You are Aurion, the 3C Mascot: energetic, motivating, a bit cheeky, and always supportive. "
-                "Reply in 1-2 short paragraphs. Vary your phrasing for returning users. "
-                "After your answer, always add this signoff, no line break, just space after the last full stop: "
-                "'Keep crushing it, Champ! Aurion'"
-            )
-            messages = [
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": user_question}
-            ]
-            response = openai_client.chat.completions.create(
-                model="gpt-4o-mini",
-                messages=messages,
-                max_tokens=300
-            )
-            answer = response.choices[0].message.content.strip()
+            key = normalize_question(user_question)
+            answer = get_cached_answer(key)
+            while answer is None and key in _inflight:
+                try:
+                    # shield: a follower giving up must not cancel the leader's call
+                    answer = await asyncio.shield(_inflight[key])
+                except AnswerAbandoned:
+                    # The leader's entry is gone by now: follow a newer leader if
+                    # one started, otherwise answer it ourselves below
+                    pass
+            if answer is None:
+                if ASK_BATCH_WINDOW_MS <= 0:
+                    await single_flight(key, stream_answer(update.message, user_question))
+                    return
+                else:
+                    answer = await single_flight(key, batched_answer(user_question))
             answer = ensure_signoff_once(answer, SIGNOFF)
         await update.message.reply_text(answer)
     except Exception as e:
         logger.error(f"Ask handler error: {e}")
         await update.message.reply_text(ensure_signoff_once(f"Sorry Champ, Aurion hit a snag getting your answer. Error details: {e}", SIGNOFF))
 
+# ------- /asklater: non-urgent questions via the OpenAI Batch API -------
+# Questions are queued in memory, submitted as one batch job every
+# ASK_LATER_SUBMIT_INTERVAL seconds (half the per-token price, separate rate
+# limits) and answered in the asker's chat when the batch completes.
+# Submitted batches survive a restart: they are tagged with ASK_LATER_TAG in
+# their metadata, their input file is deleted once every asker has been
+# answered, and on startup recover_ask_later() picks up tagged batches whose
+# input file still exists. The unsubmitted queue is submitted at shutdown, so
+# only a crash between submits loses questions.
+ASK_LATER_TAG = "aurion-asklater"
+ASK_LATER_RECOVER_WINDOW = 48 * 3600  # batches complete within 24h; look back a bit further
+ASK_LATER_SUBMIT_INTERVAL = int(os.getenv("ASK_LATER_SUBMIT_INTERVAL", "900"))
+ASK_LATER_POLL_INTERVAL = int(os.getenv("ASK_LATER_POLL_INTERVAL", "300"))
+_ask_later_queue = []    # batch request lines not yet submitted
+_ask_later_batches = {}  # batch id -> custom_ids ("chat_id:message_id") in that batch
+
+async def ask_later(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    if not context.args:
+        await update.message.reply_text("Champ, you gotta ask a question after /asklater!")
+        return
+    if not openai_client:
+        await update.message.reply_text("Sorry Champ, Aurion's answer engine isn't configured right now.")
+        return
+    user_question = " ".join(context.args)
+    _ask_later_queue.append({
+        "custom_id": f"{update.effective_chat.id}:{update.message.message_id}",
+        "method": "POST",
+        "url": "/v1/chat/completions",
+        "body": {"model": OPENAI_MODEL, "messages": build_messages(user_question), "max_tokens": 300},
+    })
+    await update.message.reply_text(
+        "Got it, Champ! Aurion will send your answer here once it's ready, usually within a few hours. "
+        "If Aurion restarts unexpectedly before then and nothing arrives, just ask again.")
+
+async def submit_ask_later(context: ContextTypes.DEFAULT_TYPE):
+    if not _ask_later_queue or not openai_client:
+        return
+    lines = _ask_later_queue[:]
+    _ask_later_queue.clear()
+    if ORJSON_AVAILABLE:
+        payload = b"\n".join(orjson.dumps(line) for line in lines)
+    else:
+        payload = "\n".join(json.dumps(line) for line in lines).encode()
+    try:
+        batch_file = await openai_client.files.create(file=("asklater.jsonl", payload), purpose="batch")
+        batch = await openai_client.batches.create(
+            input_file_id=batch_file.id,
+            endpoint="/v1/chat/completions",
+            completion_window="24h",
+            metadata={"source": ASK_LATER_TAG},
+        )
+        _ask_later_batches[batch.id] = [line["custom_id"] for line in lines]
+        logger.info(f"Submitted /asklater batch {batch.id} with {len(lines)} question(s)")
+    except Exception as e:
+        logger.error(f"Failed to submit /asklater batch: {e}")
+        # Put them back in front for the next run
+        _ask_later_queue[:0] = lines
+
+async def poll_ask_later(context: ContextTypes.DEFAULT_TYPE):
+    for batch_id, custom_ids in list(_ask_later_batches.items()):
+        try:
+            batch = await openai_client.batches.retrieve(batch_id)
+        except Exception as e:
+            logger.error(f"Failed to poll /asklater batch {batch_id}: {e}")
+            continue
+        if batch.status not in ("completed", "failed", "expired", "cancelled"):
+            continue
+        answered = set()
+        if batch.status == "completed" and batch.output_file_id:
+            try:
+                output = await openai_client.files.content(batch.output_file_id)
+            except Exception as e:
+                logger.error(f"Failed to download /asklater results for {batch_id}: {e}")
+                output = None
+            # One bad line or one chat that blocked the bot must not stop the rest
+            for line in (output.content.splitlines() if output else []):
+                try:
+                    result = orjson.loads(line) if ORJSON_AVAILABLE else json.loads(line)
+                    response = result.get("response") or {}
+                    if response.get("status_code") != 200:
+                        continue
+                    answer = response["body"]["choices"][0]["message"]["content"]
+                    chat_id = int(result["custom_id"].split(":")[0])
+                    await context.bot.send_message(chat_id, ensure_signoff_once(answer, SIGNOFF))
+                    answered.add(result["custom_id"])
+                except Exception as e:
+                    logger.error(f"Failed to deliver an /asklater answer from {batch_id}: {e}")
+        for custom_id in custom_ids:
+            if custom_id not in answered:
+                try:
+                    chat_id = int(custom_id.split(":")[0])
+                    await context.bot.send_message(chat_id, ensure_signoff_once(
+                        "Sorry Champ, Aurion couldn't get to your /asklater question. Try /ask instead", SIGNOFF))
+                except Exception as e:
+                    logger.error(f"Failed to notify {custom_id} about /asklater batch {batch_id}: {e}")
+        # Deleting the input file marks the batch handled for recover_ask_later()
+        try:
+            await openai_client.files.delete(batch.input_file_id)
+        except Exception as e:
+            logger.warning(f"Failed to delete /asklater input for {batch_id}, it may be answered again after a restart: {e}")
+        del _ask_later_batches[batch_id]
+
+async def recover_ask_later():
+    """Re-track /asklater batches submitted before a restart and not yet answered."""
+    cutoff = time.time() - ASK_LATER_RECOVER_WINDOW
+    try:
+        async for batch in openai_client.batches.list(limit=100):
+            if batch.created_at < cutoff:
+                break  # newest first
+            if (batch.metadata or {}).get("source") != ASK_LATER_TAG or batch.id in _ask_later_batches:
+                continue
+            try:
+                content = await openai_client.files.content(batch.input_file_id)
+            except NotFoundError:
+                continue  # input deleted: already answered
+            loads = orjson.loads if ORJSON_AVAILABLE else json.loads
+            _ask_later_batches[batch.id] = [loads(line)["custom_id"] for line in content.content.splitlines() if line.strip()]
+            logger.info(f"Recovered /asklater batch {batch.id} with {len(_ask_later_batches[batch.id])} question(s)")
+    except Exception as e:
+        logger.error(f"Failed to recover /asklater batches: {e}")
+
 async def id_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    await update.message.reply_text("Check out our digital 3C /id card: https://anica-blip.github.io/3c-links/")
+    await update.message.reply_text("Check out our digital 3C /id card: https://anica-blip.github.io/3c-links/", link_preview_options=NO_PREVIEW)
 
 async def rules_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    await update.message.reply_text("📜 Community Rules: https://t.me/c/2377255109/6/400")
+    await update.message.reply_text("📜 Community Rules: https://t.me/c/2377255109/6/400", link_preview_options=NO_PREVIEW)
 
 async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await update.message.reply_text(
@@ -402,6 +1143,7 @@ async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
         "/faq – Browse FAQs\n"
         "/fact – Get a random fact\n"
         "/resources – View resources\n"
+        "/asklater – Ask a non-urgent question, answered here within a few hours\n"
         "/rules – View community rules\n"
         "/id – Get the 3C Links web app\n"
     )
@@ -416,9 +1158,13 @@ TOPICS_LIST = [
     ("ClubHouse Learning", "https://t.me/c/2377255109/12"),
 ]
 
+# Rendered once at import; the lists are static. Heading and list go out as one message.
+_TOPICS_MSG = "Here are the topics:\n\n" + "\n".join(
+    f"{idx}) [{t}]({u})" for idx, (t, u) in enumerate(TOPICS_LIST, 1)
+)
+
 async def topics(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    msg_lines = [f"{idx+1}) [{t}]({u})" for idx,(t,u) in enumerate(TOPICS_LIST)]
-    await update.message.reply_text("\n".join(msg_lines), parse_mode="Markdown")
+    await update.message.reply_text(_TOPICS_MSG, parse_mode="Markdown", link_preview_options=NO_PREVIEW)
 
 HASHTAGS_LIST = [
     ("#Topics", "https://t.me/c/2431571054/58"),
@@ -431,18 +1177,29 @@ HASHTAGS_LIST = [
     ("#Healingmusic", "https://t.me/c/2431571054/58"),
 ]
 
+_HASHTAGS_MSG = "Here are the hashtags:\n\n" + "\n".join(
+    f"[{title}]({link})" for title, link in HASHTAGS_LIST
+)
+
 async def hashtags(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    msg_lines = [f"[{title}]({link})" for title, link in HASHTAGS_LIST]
-    await update.message.reply_text("\n".join(msg_lines), parse_mode="Markdown")
+    await update.message.reply_text(_HASHTAGS_MSG, parse_mode="Markdown", link_preview_options=NO_PREVIEW)
+
+_THREAD_RE = re.compile(r'/c/\d+/(\d+)')
 
 def extract_message_thread_id(link):
-    if link and isinstance(link, str):
-        match = re.search(r'/c/\d+/(?P<topicid>\d+)', link)
-        if match:
-            return int(match.group('topicid'))
-    return None
+    if not link or not isinstance(link, str) or '/c/' not in link:
+        return None
+    match = _THREAD_RE.search(link)
+    return int(match.group(1)) if match else None
 
 # Debug commands
+# Same body as public.status_sample() in migrations/003_status_sample.sql
+STATUS_SAMPLE_SQL = (
+    "SELECT json_build_object("
+    "'faq', (SELECT row_to_json(f) FROM (SELECT id, question FROM public.faq LIMIT 1) f), "
+    "'fact', (SELECT row_to_json(x) FROM (SELECT id, fact FROM public.fact LIMIT 1) x))"
+)
+
 async def dbstatus(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if USE_MODE is None:
         await update.message.reply_text("DB client not configured (USE_MODE is None).")
@@ -451,19 +1208,28 @@ async def dbstatus(update: Update, context: ContextTypes.DEFAULT_TYPE):
         out = {"mode": USE_MODE}
         try:
             if USE_MODE == "pg":
-                out["faq_sample"] = run_pg_query("SELECT id, question FROM public.faq LIMIT 1", fetchall=True)
-                out["fact_sample"] = run_pg_query("SELECT id, fact FROM public.fact LIMIT 1", fetchall=True)
+                # Both samples in one round trip
+                sample = run_pg_scalar(STATUS_SAMPLE_SQL)
+                out["faq_sample"], out["fact_sample"] = sample["faq"], sample["fact"]
             else:
-                res1 = supabase_select("faq", select_clause="id,question", limit=1)
-                out["faq_sample"] = {"data": getattr(res1, "data", None), "error": getattr(res1, "error", None)}
-                res2 = supabase_select("fact", select_clause="id,fact", limit=1)
-                out["fact_sample"] = {"data": getattr(res2, "data", None), "error": getattr(res2, "error", None)}
+                try:
+                    # status_sample() comes from migrations/003_status_sample.sql
+                    sample = execute_rest(supabase.rpc("status_sample")).data
+                    out["faq_sample"], out["fact_sample"] = sample["faq"], sample["fact"]
+                except Exception as e:
+                    out["status_sample_rpc"] = f"unavailable ({e}), using two selects"
+                    res1 = supabase_select("faq", select_clause="id,question", limit=1)
+                    out["faq_sample"] = {"data": getattr(res1, "data", None), "error": getattr(res1, "error", None)}
+                    res2 = supabase_select("fact", select_clause="id,fact", limit=1)
+                    out["fact_sample"] = {"data": getattr(res2, "data", None), "error": getattr(res2, "error", None)}
         except Exception as e:
             out["exception"] = str(e)
         return out
-    loop = asyncio.get_event_loop()
-    result = await loop.run_in_executor(None, check_tables)
-    text = json.dumps(result, default=str, indent=2)
+    result = await asyncio.to_thread(check_tables)
+    if ORJSON_AVAILABLE:
+        text = orjson.dumps(result, default=str, option=orjson.OPT_INDENT_2).decode()
+    else:
+        text = json.dumps(result, default=str, indent=2)
     if len(text) > 3800:
         text = text[:3800] + "\n\n...[truncated]"
     await update.message.reply_text("DB status:\n" + text)
@@ -527,10 +1293,8 @@ async def test_tables(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 # Error handler
 async def error_handler(update, context):
+    # exc_info lets logging format the traceback itself, once
     logger.error("Exception while handling an update:", exc_info=context.error)
-    if context.error:
-        tb_str = ''.join(traceback.format_exception(None, context.error, context.error.__traceback__))
-        logger.error(f"Traceback:\n{tb_str}")
 
 # Main
 def main():
@@ -540,11 +1304,30 @@ def main():
 
     logger.info(f"Aurion starting. USE_MODE={USE_MODE}")
 
-    app = ApplicationBuilder().token(TELEGRAM_TOKEN).build()
+    if UVLOOP_AVAILABLE:
+        # libuv-based loop; must be set before PTB creates its event loop
+        asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+        logger.info("Using uvloop event loop")
+
+    # Pace outgoing calls under Telegram's ~30 msg/s bot-wide limit instead of eating 429s.
+    # An explicit pool keeps bursts of button presses from hitting "pool is occupied" timeouts.
+    app = (
+        ApplicationBuilder()
+        .token(TELEGRAM_TOKEN)
+        .connection_pool_size(TG_POOL_SIZE)
+        .pool_timeout(30)
+        .get_updates_connection_pool_size(1)
+        .concurrent_updates(True)
+        .post_init(on_startup)
+        .post_shutdown(on_shutdown)
+        .rate_limiter(AIORateLimiter(overall_max_rate=28, overall_time_period=1, max_retries=3))
+        .build()
+    )
 
     # Handlers
     app.add_handler(CommandHandler("start", start))
     app.add_handler(CommandHandler("ask", ask))
+    app.add_handler(CommandHandler("asklater", ask_later))
     app.add_handler(CommandHandler("faq", faq))
     app.add_handler(CallbackQueryHandler(faq_button, pattern="^faq_"))
     app.add_handler(CommandHandler("fact", fact))
@@ -557,18 +1340,34 @@ def main():
     app.add_handler(CommandHandler("dbstatus", dbstatus))
     app.add_handler(CommandHandler("whichsupabase", whichsupabase))
     app.add_handler(CommandHandler("testtables", test_tables))
-    app.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, lambda u,c: None))
     app.add_error_handler(error_handler)
 
-    # Start scheduled_posts_runner in background thread (if available)
-    if SCHEDULER_AVAILABLE and scheduled_posts_runner:
-        logger.info("🚀 Starting scheduled_posts_runner in background thread...")
-        scheduled_posts_runner.start_scheduler()
+    if app.job_queue:
+        app.job_queue.run_repeating(keep_warm, interval=KEEP_WARM_INTERVAL, first=KEEP_WARM_INTERVAL)
+        app.job_queue.run_repeating(flush_greeted, interval=GREET_FLUSH_INTERVAL, first=GREET_FLUSH_INTERVAL)
+        app.job_queue.run_repeating(submit_ask_later, interval=ASK_LATER_SUBMIT_INTERVAL, first=ASK_LATER_SUBMIT_INTERVAL)
+        app.job_queue.run_repeating(poll_ask_later, interval=ASK_LATER_POLL_INTERVAL, first=ASK_LATER_POLL_INTERVAL)
     else:
+        logger.warning("JobQueue not available - keep-warm, greeting flush and /asklater jobs disabled")
+
+    # scheduled_posts_runner is started by on_startup on the bot's own event loop
+    if not (SCHEDULER_AVAILABLE and scheduled_posts_runner):
         logger.warning("⚠️ scheduled_posts_runner not available - scheduled posts will not run")
 
-    logger.info("Aurion bot starting in interactive mode...")
-    app.run_polling()
+    if WEBHOOK_URL:
+        # Telegram pushes updates to us; the token in the path keeps the endpoint unguessable
+        logger.info(f"Aurion bot starting in webhook mode on port {PORT}...")
+        app.run_webhook(
+            listen="0.0.0.0",
+            port=PORT,
+            url_path=TELEGRAM_TOKEN,
+            webhook_url=f"{WEBHOOK_URL}/{TELEGRAM_TOKEN}",
+            secret_token=WEBHOOK_SECRET,
+            allowed_updates=Update.ALL_TYPES,
+        )
+    else:
+        logger.info("Aurion bot starting in interactive mode...")
+        app.run_polling()
 
 if __name__ == "__main__":
     main()
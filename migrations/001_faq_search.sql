@@ -0,0 +1,30 @@
+-- Indexed FAQ lookup for /ask.
+-- A trigram GIN index serves both the substring (ILIKE '%q%') match the bot
+-- always did and a fuzzy similarity match for near-miss wording.
+-- Run once in the Supabase SQL editor.
+
+create extension if not exists pg_trgm;
+
+create index if not exists faq_question_trgm_idx
+    on public.faq using gin (question gin_trgm_ops);
+
+create or replace function public.search_faq(q text)
+returns text
+language sql
+stable
+as $$
+    select answer from (
+        (select answer, 2.0::real as score
+           from public.faq
+          where question ilike '%' || q || '%'
+          limit 1)
+        union all
+        (select answer, similarity(question, q) as score
+           from public.faq
+          where question % q
+          order by similarity(question, q) desc
+          limit 1)
+    ) matches
+    order by score desc
+    limit 1
+$$;
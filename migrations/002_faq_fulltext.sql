@@ -0,0 +1,40 @@
+-- Full-text FAQ matching for /ask, on top of 001_faq_search.sql.
+-- A stored tsvector with a GIN index lets search_faq() match questions that
+-- share stemmed words ("joining challenges" ~ "join a challenge") without a
+-- sequential scan. Run once in the Supabase SQL editor after 001.
+
+alter table public.faq
+    add column if not exists tsv tsvector
+    generated always as (to_tsvector('english', question)) stored;
+
+create index if not exists faq_tsv_idx
+    on public.faq using gin (tsv);
+
+-- Same contract as before; full-text hits rank between an exact substring
+-- match and a fuzzy trigram match.
+create or replace function public.search_faq(q text)
+returns text
+language sql
+stable
+as $$
+    select answer from (
+        (select answer, 3.0::real as score
+           from public.faq
+          where question ilike '%' || q || '%'
+          limit 1)
+        union all
+        (select answer, 2.0 + ts_rank(tsv, query, 32) as score
+           from public.faq, plainto_tsquery('english', q) query
+          where tsv @@ query
+          order by ts_rank(tsv, query, 32) desc
+          limit 1)
+        union all
+        (select answer, similarity(question, q) as score
+           from public.faq
+          where question % q
+          order by similarity(question, q) desc
+          limit 1)
+    ) matches
+    order by score desc
+    limit 1
+$$;
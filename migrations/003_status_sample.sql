@@ -0,0 +1,14 @@
+-- One-request sample of the faq and fact tables for the /dbstatus admin
+-- command in REST mode (direct Postgres mode runs the same query inline).
+-- Run once in the Supabase SQL editor.
+
+create or replace function public.status_sample()
+returns json
+language sql
+stable
+as $$
+    select json_build_object(
+        'faq', (select row_to_json(f) from (select id, question from public.faq limit 1) f),
+        'fact', (select row_to_json(x) from (select id, fact from public.fact limit 1) x)
+    )
+$$;
@@ -0,0 +1,51 @@
+-- Atomic claim of due posts for scheduled_posts_runner.py.
+-- One statement selects the due rows and marks them post_status = 'pending'.
+-- Rows already marked pending are never selected again, so a post is claimed
+-- once; FOR UPDATE SKIP LOCKED makes a concurrent claim skip rows another
+-- runner is marking rather than wait and pick them up after it commits.
+-- Only the columns named in p_columns come back (all of them when it's null),
+-- so the runner doesn't pull bookkeeping columns it never reads.
+-- The partial index turns the due-post filter into an index range scan.
+-- Run once in the Supabase SQL editor.
+
+create index if not exists scheduled_posts_due_idx
+    on public.scheduled_posts (service_type, posting_status, scheduled_date, scheduled_time)
+    where posting_status = 'scheduled';
+
+-- Earlier version returned whole rows; the return type can't be replaced in place
+drop function if exists public.claim_due_posts(text, date, time, integer);
+
+create or replace function public.claim_due_posts(
+    p_service_type text,
+    p_date date,
+    p_time time,
+    p_limit integer default 50,
+    p_columns text[] default null
+)
+returns setof jsonb
+language sql
+volatile
+as $$
+    with due as (
+        select id
+          from public.scheduled_posts
+         where service_type = p_service_type
+           and posting_status = 'scheduled'
+           and scheduled_date = p_date
+           and scheduled_time <= p_time
+           and post_status is distinct from 'pending'
+         order by scheduled_time
+         limit p_limit
+           for update skip locked
+    )
+    update public.scheduled_posts s
+       set post_status = 'pending'
+      from due
+     where s.id = due.id
+    returning (
+        select jsonb_object_agg(col.key, col.value)
+          from jsonb_each(to_jsonb(s)) as col
+         where p_columns is null
+            or col.key = any(p_columns)
+    )
+$$;
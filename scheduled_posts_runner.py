@@ -5,11 +5,26 @@ Bot Token: TELEGRAM_BOT_TOKEN (Aurion bot)
 TIMEZONE: WEST (UTC+1)
 """
 import os
+import re
 import time
 import json
+import asyncio
+import logging
 import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from itertools import repeat
 from datetime import datetime, timezone, timedelta
+import httpx
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# Same format as main.py; whichever module configures logging first wins
+logging.basicConfig(
+    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s", level=logging.INFO
+)
+logger = logging.getLogger(__name__)
 
 # Import Supabase client
 try:
@@ -17,9 +32,20 @@ try:
     SUPABASE_AVAILABLE = True
 except ImportError:
     SUPABASE_AVAILABLE = False
-    print("❌ ERROR: supabase-py library not installed")
+    logger.error("❌ supabase-py library not installed")
     exit(1)
 
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
+
+
+def json_loads(data):
+    return orjson.loads(data) if ORJSON_AVAILABLE else json.loads(data)
+
+
 # ============================================
 # ENVIRONMENT VARIABLES - WITH TRIMMING
 # ============================================
@@ -34,12 +60,13 @@ SERVICE_TYPE = 'Render Background/Aurion'
 # ✅ TIMEZONE CONFIGURATION - WEST = UTC+1
 WEST = timezone(timedelta(hours=1))
 EXECUTION_TIMES = ["08:55", "11:55", "14:00", "20:55"]
-last_execution = None
+# Chats posted to in parallel; posts within one chat stay in scheduled order
+POST_CONCURRENCY = max(1, int(os.getenv("POST_CONCURRENCY", "8")))
+SCHEDULE = sorted(datetime.strptime(t, "%H:%M").time() for t in EXECUTION_TIMES)
 
 # ============================================
 # VALIDATE CREDENTIALS
 # ============================================
-print("\n--- ENVIRONMENT VARIABLE CHECK ---")
 missing = []
 if not SUPABASE_DB_URL:
     missing.append("SUPABASE_DB_URL")
@@ -49,23 +76,16 @@ if not TELEGRAM_BOT_TOKEN:
     missing.append("TELEGRAM_BOT_TOKEN")
 
 if missing:
-    print("❌ Missing required environment variables:")
-    for m in missing:
-        print(f"  {m}: MISSING")
+    logger.error("❌ Missing required environment variables: %s", ", ".join(missing))
     exit(1)
 
-print(f"  SUPABASE_DB_URL: {'SET' if SUPABASE_DB_URL else 'MISSING'}")
-print(f"  SUPABASE_SERVICE_ROLE_KEY: {'SET' if SUPABASE_SERVICE_ROLE_KEY else 'MISSING'}")
-print(f"  TELEGRAM_BOT_TOKEN: {'SET' if TELEGRAM_BOT_TOKEN else 'MISSING'}")
-print("✅ Required environment variables are set\n")
+logger.info("✅ Required environment variables are set")
 
 # ============================================
 # EXTRACT SUPABASE URL FROM DB URL
 # ============================================
 def extract_supabase_url(db_url):
     """Extract Supabase project URL from database connection string"""
-    import re
-    
     # Match pattern: db.PROJECT_ID.supabase.co
     match = re.search(r'db\.([^.]+)\.supabase\.co', db_url)
     if match:
@@ -78,7 +98,8 @@ def extract_supabase_url(db_url):
         project_id = match.group(1)
         return f"https://{project_id}.supabase.co"
     
-    raise ValueError(f"Cannot extract Supabase URL from: {db_url}")
+    # Don't echo the connection string: it carries the database password
+    raise ValueError("Cannot extract Supabase project URL from SUPABASE_DB_URL")
 
 SUPABASE_URL = extract_supabase_url(SUPABASE_DB_URL)
 
@@ -88,177 +109,277 @@ SUPABASE_URL = extract_supabase_url(SUPABASE_DB_URL)
 # Python supabase-py automatically handles headers when using SERVICE_ROLE_KEY
 supabase = create_client(SUPABASE_URL, SUPABASE_SERVICE_ROLE_KEY)
 
-print(f"[{datetime.now(WEST).isoformat()}] Render Background Worker initialized")
-print(f"Supabase URL: {SUPABASE_URL}")
-print(f"Service Type: {SERVICE_TYPE}")
-print(f"Timezone: WEST (UTC+1)")
-print(f"Execution Times: {EXECUTION_TIMES}")
+
+def pool_supabase_http(client):
+    """Replace postgrest's default httpx session with a keep-alive pool sized
+    for the per-chat worker threads (same base URL and auth headers), so the
+    claim, status updates and dashboard writes reuse TLS connections"""
+    try:
+        rest = client.postgrest
+        old = rest.session
+        rest.session = httpx.Client(
+            base_url=old.base_url,
+            headers=old.headers,
+            timeout=httpx.Timeout(30.0, connect=5.0),
+            http2=True,
+            limits=httpx.Limits(max_connections=POST_CONCURRENCY + 2, max_keepalive_connections=POST_CONCURRENCY, keepalive_expiry=60),
+        )
+        old.close()
+    except Exception as e:
+        logger.warning(f"⚠️ Could not configure Supabase connection pool, using defaults: {e}")
+
+
+pool_supabase_http(supabase)
+
+logger.info(f"Render Background Worker initialized: {SUPABASE_URL}, service type '{SERVICE_TYPE}', "
+            f"execution times {EXECUTION_TIMES} WEST (UTC+1)")
 
 # ============================================
 # TELEGRAM API FUNCTIONS
 # ============================================
 
+# One keep-alive session for all Bot API calls, so a batch of posts reuses
+# the TLS connection to api.telegram.org instead of reconnecting per send
+TELEGRAM_SESSION = requests.Session()
+TELEGRAM_SESSION.mount("https://", HTTPAdapter(
+    pool_connections=4,
+    pool_maxsize=32,
+    # Only retry failed connects here, which can't double-post. A 5xx or read
+    # timeout may already have delivered the message, so those are left to the
+    # job's attempts; 429s are retried by _send, which can read retry_after.
+    max_retries=Retry(
+        total=3,
+        connect=3,
+        read=0,
+        status=0,
+        backoff_factor=0.3,
+        allowed_methods=frozenset({"POST"}),
+        raise_on_status=False,
+    ),
+))
+TELEGRAM_TIMEOUT = (5, 60)  # (connect, read) seconds; uploads from URLs can be slow
+# 429 handling in _send: retries per call, and the longest retry_after worth
+# waiting out in a worker thread (longer flood waits fail the post for a later slot)
+TELEGRAM_429_RETRIES = 3
+TELEGRAM_RETRY_AFTER_MAX = 60
+TELEGRAM_API = f"https://api.telegram.org/bot{TELEGRAM_BOT_TOKEN}"
+
+def format_hashtags(tags):
+    """Space-separated hashtags, adding '#' where a tag lacks it"""
+    return ' '.join(tag if tag[:1] == '#' else '#' + tag for tag in tags)
+
+
 def build_caption(post):
     """Build caption from post data"""
-    post_content = post.get('post_content', {})
-    
-    if not post_content:
-        caption = ''
-        if post.get('title'):
-            caption += f"{post['title']}\n\n"
-        if post.get('description'):
-            caption += f"{post['description']}\n"
-        if post.get('hashtags'):
-            tags = ' '.join([tag if tag.startswith('#') else f'#{tag}' for tag in post['hashtags']])
-            caption += f"\n{tags}"
-        if post.get('cta'):
-            caption += f"\n\n👉 {post['cta']}"
-        return caption.strip()
+    post_content = post.get('post_content') or {}
+    # Text fields come from post_content when present, else from the row itself
+    source = post_content or post
+    parts = []
     
-    caption = ''
-    
-    name = post_content.get('name') or post.get('name')
-    username = post_content.get('username') or post.get('username')
-    role = post_content.get('role') or post.get('role')
-    
-    if name:
-        caption += f"<b>{name}</b>\n"
-        if username:
-            formatted_username = username if username.startswith('@') else f'@{username}'
-            caption += f"{formatted_username}\n"
-        if role:
-            caption += f"{role}\n"
-        caption += "\n"
+    if post_content:
+        name = post_content.get('name') or post.get('name')
+        username = post_content.get('username') or post.get('username')
+        role = post_content.get('role') or post.get('role')
+        
+        if name:
+            parts.append(f"<b>{name}</b>\n")
+            if username:
+                formatted_username = username if username.startswith('@') else f'@{username}'
+                parts.append(f"{formatted_username}\n")
+            if role:
+                parts.append(f"{role}\n")
+            parts.append("\n")
     
-    if post_content.get('title'):
-        caption += f"{post_content['title']}\n\n"
+    if source.get('title'):
+        parts.append(f"{source['title']}\n\n")
     
-    if post_content.get('description'):
-        caption += f"{post_content['description']}\n"
+    if source.get('description'):
+        parts.append(f"{source['description']}\n")
     
-    if post_content.get('hashtags'):
-        tags = ' '.join([tag if tag.startswith('#') else f'#{tag}' for tag in post_content['hashtags']])
-        caption += f"\n{tags}"
+    if source.get('hashtags'):
+        parts.append(f"\n{format_hashtags(source['hashtags'])}")
     
-    if post_content.get('cta'):
-        caption += f"\n\n👉 {post_content['cta']}"
+    if source.get('cta'):
+        parts.append(f"\n\n👉 {source['cta']}")
     
-    return caption.strip()
+    return ''.join(parts).strip()
 
 
-def send_telegram_message(chat_id, text, thread_id=None):
-    """Send text message to Telegram"""
-    url = f"https://api.telegram.org/bot{TELEGRAM_BOT_TOKEN}/sendMessage"
-    
-    payload = {
-        'chat_id': chat_id,
-        'text': text,
-        'parse_mode': 'HTML'
-    }
-    
+TELEGRAM_ENDPOINTS = {
+    'message': f"{TELEGRAM_API}/sendMessage",
+    'photo': f"{TELEGRAM_API}/sendPhoto",
+    'video': f"{TELEGRAM_API}/sendVideo",
+    'animation': f"{TELEGRAM_API}/sendAnimation",
+    'media_group': f"{TELEGRAM_API}/sendMediaGroup",
+}
+MEDIA_GROUP_MAX = 10  # items Telegram accepts in one album
+
+
+def _send(kind, payload, thread_id=None):
+    """POST a payload to the Bot API send method for `kind`"""
     if thread_id:
         payload['message_thread_id'] = int(thread_id)
     
-    response = requests.post(url, json=payload)
-    data = response.json()
+    if ORJSON_AVAILABLE:
+        request = {'data': orjson.dumps(payload), 'headers': {'Content-Type': 'application/json'}}
+    else:
+        request = {'json': payload}
+    
+    for attempt in range(TELEGRAM_429_RETRIES + 1):
+        response = TELEGRAM_SESSION.post(TELEGRAM_ENDPOINTS[kind], timeout=TELEGRAM_TIMEOUT, **request)
+        data = json_loads(response.content)
+        if response.status_code != 429 or attempt == TELEGRAM_429_RETRIES:
+            break
+        # Telegram puts the wait in the body, not only in a Retry-After header
+        retry_after = (data.get('parameters') or {}).get('retry_after', 1)
+        if retry_after > TELEGRAM_RETRY_AFTER_MAX:
+            break
+        logger.warning(f"Telegram rate limit on {kind} to {payload['chat_id']}, retrying in {retry_after}s")
+        time.sleep(retry_after)
     
     if not response.ok or not data.get('ok'):
         return {
             'success': False,
-            'error': data.get('description', f'HTTP {response.status_code}')
+            'error': data.get('description', f'HTTP {response.status_code}'),
+            'status_code': response.status_code,
+            'rate_limited': response.status_code == 429
+        }
+    
+    result = data.get('result', {})
+    if isinstance(result, list):
+        # sendMediaGroup answers with one message per item; the first stands for the post
+        return {
+            'success': True,
+            'message_id': result[0].get('message_id') if result else None,
+            'file_id': None
         }
     
+    # Telegram's id for the uploaded media; resending it skips the download from the URL
+    media = result.get(kind)
+    if kind == 'photo' and media:
+        media = media[-1]
+    
     return {
         'success': True,
-        'message_id': data.get('result', {}).get('message_id')
+        'message_id': result.get('message_id'),
+        'file_id': media.get('file_id') if isinstance(media, dict) else None
     }
 
 
+def send_telegram_message(chat_id, text, thread_id=None):
+    """Send text message to Telegram"""
+    return _send('message', {'chat_id': chat_id, 'text': text, 'parse_mode': 'HTML'}, thread_id)
+
+
 def send_telegram_photo(chat_id, photo_url, caption, thread_id=None):
     """Send photo to Telegram"""
-    url = f"https://api.telegram.org/bot{TELEGRAM_BOT_TOKEN}/sendPhoto"
-    
-    payload = {
-        'chat_id': chat_id,
-        'photo': photo_url,
-        'caption': caption,
-        'parse_mode': 'HTML'
-    }
-    
-    if thread_id:
-        payload['message_thread_id'] = int(thread_id)
-    
-    response = requests.post(url, json=payload)
-    data = response.json()
-    
-    if not response.ok or not data.get('ok'):
-        return {
-            'success': False,
-            'error': data.get('description', f'HTTP {response.status_code}')
-        }
-    
-    return {
-        'success': True,
-        'message_id': data.get('result', {}).get('message_id')
-    }
+    return _send('photo', {'chat_id': chat_id, 'photo': photo_url, 'caption': caption, 'parse_mode': 'HTML'}, thread_id)
 
 
 def send_telegram_video(chat_id, video_url, caption, thread_id=None):
     """Send video to Telegram"""
-    url = f"https://api.telegram.org/bot{TELEGRAM_BOT_TOKEN}/sendVideo"
-    
-    payload = {
-        'chat_id': chat_id,
-        'video': video_url,
-        'caption': caption,
-        'parse_mode': 'HTML'
-    }
-    
-    if thread_id:
-        payload['message_thread_id'] = int(thread_id)
-    
-    response = requests.post(url, json=payload)
-    data = response.json()
-    
-    if not response.ok or not data.get('ok'):
-        return {
-            'success': False,
-            'error': data.get('description', f'HTTP {response.status_code}')
-        }
-    
-    return {
-        'success': True,
-        'message_id': data.get('result', {}).get('message_id')
-    }
+    return _send('video', {'chat_id': chat_id, 'video': video_url, 'caption': caption, 'parse_mode': 'HTML'}, thread_id)
 
 
 def send_telegram_animation(chat_id, animation_url, caption, thread_id=None):
     """Send animation/GIF to Telegram"""
-    url = f"https://api.telegram.org/bot{TELEGRAM_BOT_TOKEN}/sendAnimation"
-    
-    payload = {
-        'chat_id': chat_id,
-        'animation': animation_url,
-        'caption': caption,
-        'parse_mode': 'HTML'
-    }
+    return _send('animation', {'chat_id': chat_id, 'animation': animation_url, 'caption': caption, 'parse_mode': 'HTML'}, thread_id)
+
+
+def send_telegram_media_group(chat_id, items, caption, thread_id=None):
+    """Send up to MEDIA_GROUP_MAX (media type, URL) pairs as one album, captioned
+    on the first item as Telegram shows it"""
+    media = [{'type': media_type, 'media': url} for media_type, url in items]
+    media[0].update({'caption': caption, 'parse_mode': 'HTML'})
+    return _send('media_group', {'chat_id': chat_id, 'media': media}, thread_id)
+
+
+_ANIMATION_TYPES = frozenset({'animation', 'gif'})
+_ANIMATION_EXTS = frozenset({'gif'})
+_VIDEO_EXTS = frozenset({'mp4', 'mov', 'avi', 'mkv', 'webm'})
+
+
+# Retried and re-scheduled posts reuse the same media URLs
+@lru_cache(maxsize=4096)
+def file_extension(name):
+    """Lower-case extension of a file name or URL, ignoring any query/fragment"""
+    path = name.lower().split('?', 1)[0].split('#', 1)[0]
+    _, dot, ext = path.rpartition('.')
+    return ext if dot and '/' not in ext else ''
+
+
+def detect_media_type(media_item):
+    """'animation', 'video' or 'photo' for a media_files entry"""
+    media_type = (media_item.get('type') or '').lower()
+    ext = file_extension(media_item.get('name') or media_item.get('url') or '')
     
-    if thread_id:
-        payload['message_thread_id'] = int(thread_id)
+    # GIFs first: Telegram plays them as animations even when typed as video
+    if media_type in _ANIMATION_TYPES or ext in _ANIMATION_EXTS:
+        return 'animation'
+    if media_type == 'video' or ext in _VIDEO_EXTS:
+        return 'video'
+    return 'photo'
+
+
+MEDIA_SENDERS = {
+    'animation': send_telegram_animation,
+    'video': send_telegram_video,
+    'photo': send_telegram_photo,
+}
+
+# (media type, URL) -> Telegram file_id of an earlier upload, so the same asset
+# posted to several chats is fetched from its origin only once
+MEDIA_FILE_ID_CACHE_MAX = 1024
+_media_file_ids = {}
+_media_file_ids_lock = threading.Lock()
+
+
+def stale_file_id(result):
+    """True when Telegram rejected the request because of the file_id itself
+    (e.g. 'Bad Request: wrong file identifier/HTTP URL specified')"""
+    return result.get('status_code') == 400 and 'file identifier' in (result.get('error') or '').lower()
+
+
+def send_media(media_type, chat_id, media_url, caption, thread_id=None):
+    """Send media by URL, or by the cached file_id once Telegram has it"""
+    send = MEDIA_SENDERS[media_type]
+    key = (media_type, media_url)
+    file_id = _media_file_ids.get(key)
     
-    response = requests.post(url, json=payload)
-    data = response.json()
+    result = send(chat_id, file_id or media_url, caption, thread_id)
+    if file_id and not result['success'] and stale_file_id(result):
+        # Telegram no longer accepts this file_id; upload from the URL again.
+        # Any other failure is returned as-is: a 5xx may already have posted.
+        with _media_file_ids_lock:
+            _media_file_ids.pop(key, None)
+        result = send(chat_id, media_url, caption, thread_id)
+        file_id = None
     
-    if not response.ok or not data.get('ok'):
-        return {
-            'success': False,
-            'error': data.get('description', f'HTTP {response.status_code}')
-        }
+    if result['success'] and not file_id and result.get('file_id'):
+        with _media_file_ids_lock:
+            if len(_media_file_ids) >= MEDIA_FILE_ID_CACHE_MAX:
+                _media_file_ids.pop(next(iter(_media_file_ids)))
+            _media_file_ids[key] = result['file_id']
     
-    return {
-        'success': True,
-        'message_id': data.get('result', {}).get('message_id')
-    }
+    return result
+
+
+# Telegram's limits, counted on the text after HTML tags are parsed out
+CAPTION_LIMIT = 1024
+MESSAGE_LIMIT = 4096
+_TAG_RE = re.compile(r'<[^>]+>')
+
+
+def too_long(text, limit):
+    # Tags only ever shorten the visible text, so skip the regex when the raw length fits
+    return len(text) > limit and len(_TAG_RE.sub('', text)) > limit
+
+
+def send_outcome(result):
+    """post_to_telegram's result for a send_telegram_* result"""
+    if result['success']:
+        return {'success': True, 'post_id': result.get('message_id')}
+    return {'success': False, 'error': result.get('error'), 'rate_limited': result.get('rate_limited', False)}
 
 
 def post_to_telegram(post):
@@ -274,13 +395,26 @@ def post_to_telegram(post):
         
         # Check for media files
         media_files = post.get('media_files') or (post.get('post_content', {}).get('media_files'))
+        # Rows written as text rather than jsonb come back as a JSON string
+        if isinstance(media_files, str):
+            media_files = json_loads(media_files)
+        
+        limit = CAPTION_LIMIT if media_files else MESSAGE_LIMIT
+        if too_long(caption, limit):
+            # Resending can't fix this; don't spend the post's retry attempts on it
+            return {'success': False, 'permanent': True, 'error': f'Caption longer than {limit} characters'}
         
         if not media_files or len(media_files) == 0:
             # Text-only post
             result = send_telegram_message(channel_group_id, caption, thread_id)
-            if result['success']:
-                return {'success': True, 'post_id': result.get('message_id')}
-            return {'success': False, 'error': result.get('error')}
+            return send_outcome(result)
+        
+        # Several photos/videos go out as one album. Albums can't hold GIFs, so
+        # those posts keep sending only their first file.
+        album = [(detect_media_type(m), m.get('url')) for m in media_files[:MEDIA_GROUP_MAX]]
+        if len(album) > 1 and all(url and media_type != 'animation' for media_type, url in album):
+            result = send_telegram_media_group(channel_group_id, album, caption, thread_id)
+            return send_outcome(result)
         
         # Get first media file
         first_media = media_files[0]
@@ -289,36 +423,10 @@ def post_to_telegram(post):
         if not media_url:
             return {'success': False, 'error': 'Media file has no URL'}
         
-        # Detect media type
-        media_type = (first_media.get('type') or '').lower()
-        file_name = (first_media.get('name') or media_url).lower()
-        
-        # Check if it's a GIF/animation
-        is_animation = (
-            media_type == 'animation' or
-            media_type == 'gif' or
-            file_name.endswith('.gif')
-        )
-        
-        # Check if it's a video
-        is_video = (
-            media_type == 'video' or
-            any(file_name.endswith(ext) for ext in ['.mp4', '.mov', '.avi', '.mkv', '.webm'])
-        )
-        
         # Send appropriate media type
-        if is_animation:
-            result = send_telegram_animation(channel_group_id, media_url, caption, thread_id)
-        elif is_video:
-            result = send_telegram_video(channel_group_id, media_url, caption, thread_id)
-        else:
-            # Default to photo
-            result = send_telegram_photo(channel_group_id, media_url, caption, thread_id)
-        
-        if result['success']:
-            return {'success': True, 'post_id': result.get('message_id')}
+        result = send_media(detect_media_type(first_media), channel_group_id, media_url, caption, thread_id)
         
-        return {'success': False, 'error': result.get('error')}
+        return send_outcome(result)
         
     except Exception as e:
         return {'success': False, 'error': str(e)}
@@ -328,42 +436,136 @@ def post_to_telegram(post):
 # JOB PROCESSING FUNCTIONS
 # ============================================
 
-def claim_jobs(limit=50):
+# dashboard_posts columns copied straight from the scheduled_posts row
+_DASHBOARD_COPY_KEYS = (
+    'social_platform', 'post_content', 'channel_group_id', 'thread_id',
+    'scheduled_date', 'scheduled_time', 'user_id', 'created_by', 'content_id',
+    'platform_id', 'platform', 'service_type', 'platform_icon', 'type', 'status',
+)
+# Columns taken from the row, or from post_content when the row's is empty
+_DASHBOARD_CONTENT_KEYS = (
+    'character_profile', 'name', 'username', 'role', 'character_avatar',
+    'title', 'description', 'hashtags', 'keywords', 'cta', 'theme', 'audience',
+    'voice_style', 'media_type', 'template_type', 'media_files', 'selected_platforms',
+)
+# Everything process_post and the dashboard row read; skips bookkeeping columns
+CLAIM_COLUMN_NAMES = ('id', 'attempts', 'url') + _DASHBOARD_COPY_KEYS + _DASHBOARD_CONTENT_KEYS
+CLAIM_COLUMNS = ','.join(CLAIM_COLUMN_NAMES)
+
+
+# claim_due_posts() comes from migrations/004_claim_due_posts.sql. If the function
+# doesn't exist (migration not applied) we stop trying and claim with select + update.
+_claim_rpc = True
+# PostgREST / Postgres error codes for a function or column that doesn't exist
+MISSING_FUNCTION_CODES = frozenset({'PGRST202', '42883'})
+MISSING_COLUMN_CODES = frozenset({'42703', 'PGRST204'})
+
+
+def postgrest_error_code(error):
+    """Error code of a postgrest APIError, None for anything else (network, timeouts)"""
+    return getattr(error, 'code', None)
+
+
+def claim_jobs_rpc(current_date, current_time, limit):
+    """Select and claim due posts in one statement (FOR UPDATE SKIP LOCKED)"""
+    response = supabase.rpc('claim_due_posts', {
+        'p_service_type': SERVICE_TYPE,
+        'p_date': current_date,
+        'p_time': current_time,
+        'p_limit': limit,
+        'p_columns': list(CLAIM_COLUMN_NAMES)
+    }).execute()
+    # UPDATE ... RETURNING has no order; each chat's posts go out in scheduled order
+    return sorted(response.data or [], key=lambda post: post['scheduled_time'])
+
+
+_claim_columns = CLAIM_COLUMNS
+
+
+def select_due_posts(columns, current_date, current_time, limit):
+    return supabase.table('scheduled_posts')\
+        .select(columns)\
+        .eq('service_type', SERVICE_TYPE)\
+        .eq('posting_status', 'scheduled')\
+        .eq('scheduled_date', current_date)\
+        .lte('scheduled_time', current_time)\
+        .or_('post_status.is.null,post_status.neq.pending')\
+        .order('scheduled_time')\
+        .limit(limit)\
+        .execute()
+
+
+def log_stuck_posts():
+    """Warn about claimed posts still 'pending' before a new claim. Normally
+    none: a pass either deletes its posts or marks them failed. What's left was
+    sent but not recorded, or its runner died mid-pass (or another runner is
+    working on it right now), and is never claimed again automatically."""
+    try:
+        response = supabase.table('scheduled_posts')\
+            .select('id,scheduled_date,scheduled_time')\
+            .eq('service_type', SERVICE_TYPE)\
+            .eq('posting_status', 'scheduled')\
+            .eq('post_status', 'pending')\
+            .limit(50)\
+            .execute()
+    except Exception as e:
+        logger.warning(f"Could not check for stuck pending posts: {e}")
+        return
+    stuck = response.data or []
+    if stuck:
+        logger.warning(
+            f"⚠️ {len(stuck)} post(s) stuck in 'pending': "
+            + ", ".join(f"{p['id']} ({p['scheduled_date']} {p['scheduled_time']})" for p in stuck)
+            + ". Check the chat; clear post_status to resend or delete the row if it went out."
+        )
+
+
+def claim_jobs(limit=50, now_utc=None):
     """Query and claim jobs from scheduled_posts table using Supabase REST API"""
     try:
-        now_utc = datetime.now(timezone.utc)
+        now_utc = now_utc or datetime.now(timezone.utc)
         now_west = now_utc.astimezone(WEST)
         
         current_date = now_west.strftime("%Y-%m-%d")
         current_time = now_west.strftime("%H:%M:%S")
         
-        print(f"\n{'='*60}")
-        print('Querying pending jobs...')
-        print(f"UTC: {now_utc.isoformat()}")
-        print(f"WEST: {now_west.isoformat()}")
-        print(f"Current Date: {current_date}")
-        print(f"Current Time: {current_time}")
-        print(f"Service Type: '{SERVICE_TYPE}'")
-        print(f"{'='*60}\n")
+        logger.info(f"Querying pending jobs for '{SERVICE_TYPE}' due by {current_date} {current_time} WEST")
+        log_stuck_posts()
+        
+        global _claim_rpc
+        if _claim_rpc:
+            try:
+                posts = claim_jobs_rpc(current_date, current_time, limit)
+                if posts:
+                    logger.info(f"✅ Claimed {len(posts)} job(s) for processing")
+                else:
+                    logger.info("No pending jobs found")
+                return posts
+            except Exception as e:
+                if postgrest_error_code(e) not in MISSING_FUNCTION_CODES:
+                    # Transient (timeout, dropped connection): skip this slot, retry next one
+                    raise
+                logger.warning(f"⚠️ claim_due_posts RPC unavailable (apply migrations/004_claim_due_posts.sql), falling back to select + update: {e}")
+                _claim_rpc = False
         
         # Query scheduled_posts using Supabase REST API
-        response = supabase.table('scheduled_posts')\
-            .select('*')\
-            .eq('service_type', SERVICE_TYPE)\
-            .eq('posting_status', 'scheduled')\
-            .eq('scheduled_date', current_date)\
-            .lte('scheduled_time', current_time)\
-            .order('scheduled_time')\
-            .limit(limit)\
-            .execute()
+        global _claim_columns
+        try:
+            response = select_due_posts(_claim_columns, current_date, current_time, limit)
+        except Exception as e:
+            if _claim_columns == '*' or postgrest_error_code(e) not in MISSING_COLUMN_CODES:
+                raise
+            # A listed column this table doesn't have; read whole rows from now on
+            logger.warning(f"⚠️ Explicit column select failed, using select('*'): {e}")
+            _claim_columns = '*'
+            response = select_due_posts(_claim_columns, current_date, current_time, limit)
         
         posts = response.data or []
         
         if not posts:
-            print("No pending jobs found")
+            logger.info("No pending jobs found")
             return []
         
-        print(f"Found {len(posts)} pending job(s)")
         
         # Claim jobs by updating status to 'pending'
         post_ids = [post['id'] for post in posts]
@@ -374,147 +576,161 @@ def claim_jobs(limit=50):
             .eq('service_type', SERVICE_TYPE)\
             .execute()
         
-        print(f"✅ Claimed {len(posts)} job(s) for processing")
+        logger.info(f"✅ Claimed {len(posts)} job(s) for processing")
         
         return posts
         
     except Exception as e:
-        print(f"Error in claim_jobs: {str(e)}")
+        logger.error(f"Error in claim_jobs: {e}")
         raise
 
 
-def process_post(post):
-    """Process a single post"""
-    now = datetime.now(timezone.utc)
-    print(f"\n--- Processing Post {post['id']} ---")
+def fail_post(post, error_message, permanent=False, rate_limited=False):
+    """Record a failed send attempt; returns process_post's (None, error) result.
+    Rate-limited sends never reached the chat, so they don't use up an attempt."""
+    if rate_limited:
+        logger.warning(f"⏳ Post {post['id']} rate limited by Telegram, retrying next slot: {error_message}")
+    else:
+        logger.error(f"❌ Failed to process post {post['id']}: {error_message}")
+    
+    max_retries = 3
+    new_attempts = (post.get('attempts') or 0) + (0 if rate_limited else 1)
+    should_retry = new_attempts < max_retries and not permanent
     
     try:
-        if not post.get('channel_group_id'):
-            raise Exception('Missing channel_group_id')
-        
-        if not post.get('post_content') and not post.get('description') and not post.get('title'):
-            raise Exception('Missing post content')
-        
-        post_result = post_to_telegram(post)
-        
-        if not post_result['success']:
-            raise Exception(post_result.get('error', 'Failed to post to Telegram'))
+        update_data = {
+            'post_status': 'failed',
+            'attempts': new_attempts
+        }
         
-        external_post_id = post_result.get('post_id', 'unknown')
+        if not should_retry:
+            update_data['posting_status'] = 'failed'
         
+        supabase.table('scheduled_posts')\
+            .update(update_data)\
+            .eq('id', post['id'])\
+            .eq('service_type', SERVICE_TYPE)\
+            .execute()
+    except Exception as fail_error:
+        logger.error(f"Failed to update error status for post {post['id']}: {fail_error}")
+    
+    return None, error_message
+
+
+def process_post(post, now_iso):
+    """Send a single post and mark it sent. Returns (dashboard_posts row, None),
+    or (None, error message) once the failure is recorded.
+    now_iso is the batch's timestamp, used for updated_at and posted_at"""
+    if not post.get('channel_group_id'):
+        return fail_post(post, 'Missing channel_group_id')
+    
+    if not post.get('post_content') and not post.get('description') and not post.get('title'):
+        return fail_post(post, 'Missing post content')
+    
+    post_result = post_to_telegram(post)
+    
+    if not post_result['success']:
+        # Resending can't fix a permanent rejection; don't spend retries on it
+        return fail_post(post, post_result.get('error') or 'Failed to post to Telegram',
+                         permanent=post_result.get('permanent', False),
+                         rate_limited=post_result.get('rate_limited', False))
+    
+    external_post_id = post_result.get('post_id', 'unknown')
+    
+    # The post is live in the chat from here on. Errors must not go through
+    # fail_post: that would make the row claimable again and post it twice.
+    # The row stays 'pending' instead, which log_stuck_posts reports.
+    try:
         # Update scheduled_posts
         supabase.table('scheduled_posts')\
             .update({
                 'posting_status': 'sent',
                 'post_status': 'sent',
-                'updated_at': now.isoformat()
+                'updated_at': now_iso
             })\
             .eq('id', post['id'])\
             .eq('service_type', SERVICE_TYPE)\
             .execute()
+    except Exception as e:
+        # Still recorded below; record_sent_posts then removes the row anyway
+        logger.error(f"⚠️ Post {post['id']} was sent as message {external_post_id} but marking it sent failed: {e}")
+    
+    try:
+        # Row for dashboard_posts
+        post_content = post.get('post_content') or {}
         
-        # Insert into dashboard_posts
-        post_content = post.get('post_content', {})
-        
-        dashboard_post = {
+        dashboard_post = {key: post.get(key) for key in _DASHBOARD_COPY_KEYS}
+        for key in _DASHBOARD_CONTENT_KEYS:
+            dashboard_post[key] = post.get(key) or post_content.get(key)
+        dashboard_post.update({
             'scheduled_post_id': post['id'],
-            'social_platform': post.get('social_platform'),
-            'post_content': post.get('post_content'),
             'external_post_id': external_post_id,
-            'posted_at': now.isoformat(),
-            'url': f"https://t.me/c/{post['channel_group_id'].replace('-100', '')}/{external_post_id}" if external_post_id != 'unknown' else post.get('url'),
-            'channel_group_id': post.get('channel_group_id'),
-            'thread_id': post.get('thread_id'),
-            'character_profile': post.get('character_profile') or post_content.get('character_profile'),
-            'name': post.get('name') or post_content.get('name'),
-            'username': post.get('username') or post_content.get('username'),
-            'role': post.get('role') or post_content.get('role'),
-            'character_avatar': post.get('character_avatar') or post_content.get('character_avatar'),
-            'title': post.get('title') or post_content.get('title'),
-            'description': post.get('description') or post_content.get('description'),
-            'hashtags': post.get('hashtags') or post_content.get('hashtags'),
-            'keywords': post.get('keywords') or post_content.get('keywords'),
-            'cta': post.get('cta') or post_content.get('cta'),
-            'theme': post.get('theme') or post_content.get('theme'),
-            'audience': post.get('audience') or post_content.get('audience'),
-            'voice_style': post.get('voice_style') or post_content.get('voice_style'),
-            'media_type': post.get('media_type') or post_content.get('media_type'),
-            'template_type': post.get('template_type') or post_content.get('template_type'),
-            'scheduled_date': post.get('scheduled_date'),
-            'scheduled_time': post.get('scheduled_time'),
-            'user_id': post.get('user_id'),
-            'created_by': post.get('created_by'),
-            'content_id': post.get('content_id'),
-            'platform_id': post.get('platform_id'),
-            'media_files': post.get('media_files') or post_content.get('media_files'),
-            'selected_platforms': post.get('selected_platforms') or post_content.get('selected_platforms'),
-            'platform': post.get('platform'),
-            'service_type': post.get('service_type'),
-            'platform_icon': post.get('platform_icon'),
-            'type': post.get('type'),
-            'status': post.get('status')
-        }
-        
-        try:
-            supabase.table('dashboard_posts').insert(dashboard_post).execute()
-            print(f"✅ Inserted into dashboard_posts")
-        except Exception as e:
-            print(f"⚠️ Failed to insert into dashboard_posts: {str(e)}")
-        
-        # Delete from scheduled_posts
-        try:
-            supabase.table('scheduled_posts')\
-                .delete()\
-                .eq('id', post['id'])\
-                .eq('service_type', SERVICE_TYPE)\
-                .execute()
-            print(f"✅ Deleted post {post['id']} from scheduled_posts")
-        except Exception as e:
-            print(f"⚠️ Failed to delete from scheduled_posts: {str(e)}")
-        
-        print(f"✅ Post {post['id']} completed successfully")
-        
+            'posted_at': now_iso,
+            'url': f"https://t.me/c/{str(post['channel_group_id']).replace('-100', '')}/{external_post_id}" if external_post_id != 'unknown' else post.get('url'),
+        })
     except Exception as e:
-        error_message = str(e)
-        print(f"❌ Failed to process post {post['id']}: {error_message}")
-        
-        max_retries = 3
-        new_attempts = (post.get('attempts') or 0) + 1
-        should_retry = new_attempts < max_retries
-        
-        try:
-            update_data = {
-                'post_status': 'failed',
-                'attempts': new_attempts
-            }
-            
-            if not should_retry:
-                update_data['posting_status'] = 'failed'
-            
-            supabase.table('scheduled_posts')\
-                .update(update_data)\
-                .eq('id', post['id'])\
-                .eq('service_type', SERVICE_TYPE)\
-                .execute()
-        except Exception as fail_error:
-            print(f"Failed to update error status: {str(fail_error)}")
-        
-        raise
+        logger.error(f"⚠️ Post {post['id']} was sent as message {external_post_id} but can't be recorded, left 'pending': {e}")
+        return None, f"sent as message {external_post_id} but not recorded: {e}"
+    
+    logger.info(f"✅ Post {post['id']} sent")
+    return dashboard_post, None
+
+
+def process_chat_posts(chat_posts, now_iso):
+    """Process one chat's posts in order; returns (dashboard rows, error strings)"""
+    rows = []
+    errors = []
+    for post in chat_posts:
+        row, error = process_post(post, now_iso)
+        if error is None:
+            rows.append(row)
+        else:
+            errors.append(f"Post {post['id']}: {error}")
+    return rows, errors
+
+
+def record_sent_posts(dashboard_rows):
+    """Copy sent posts into dashboard_posts and remove them from scheduled_posts,
+    one request each for the whole batch"""
+    if not dashboard_rows:
+        return
+    
+    try:
+        supabase.table('dashboard_posts').insert(dashboard_rows).execute()
+        logger.info(f"✅ Inserted {len(dashboard_rows)} row(s) into dashboard_posts")
+    except Exception as e:
+        # One bad row fails the whole insert; retry row by row so the rest still land
+        logger.warning(f"⚠️ Batch insert into dashboard_posts failed, inserting one by one: {e}")
+        for row in dashboard_rows:
+            try:
+                supabase.table('dashboard_posts').insert(row).execute()
+            except Exception as row_error:
+                logger.warning(f"⚠️ Failed to insert post {row['scheduled_post_id']} into dashboard_posts: {row_error}")
+    
+    post_ids = [row['scheduled_post_id'] for row in dashboard_rows]
+    try:
+        supabase.table('scheduled_posts')\
+            .delete()\
+            .in_('id', post_ids)\
+            .eq('service_type', SERVICE_TYPE)\
+            .execute()
+        logger.info(f"✅ Deleted {len(post_ids)} sent post(s) from scheduled_posts")
+    except Exception as e:
+        logger.warning(f"⚠️ Failed to delete from scheduled_posts: {e}")
 
 
 def process_jobs():
     """Process all due jobs"""
     start_time = datetime.now(timezone.utc)
-    print(f"\n{'='*60}")
-    print(f"Processing Started: {start_time.isoformat()}")
-    print(f"{'='*60}\n")
+    # One timestamp for the whole batch instead of a clock read and format per post
+    start_iso = start_time.isoformat()
     
     errors = []
     succeeded = 0
     failed = 0
     
     try:
-        posts = claim_jobs(50)
+        posts = claim_jobs(50, start_time)
         
         if not posts:
             return {
@@ -522,91 +738,105 @@ def process_jobs():
                 'succeeded': 0,
                 'failed': 0,
                 'errors': [],
-                'timestamp': start_time.isoformat()
+                'timestamp': start_iso
             }
         
+        # Different chats don't wait on each other's round trips
+        by_chat = {}
         for post in posts:
-            try:
-                process_post(post)
-                succeeded += 1
-            except Exception as e:
-                failed += 1
-                errors.append(f"Post {post['id']}: {str(e)}")
+            by_chat.setdefault(post.get('channel_group_id'), []).append(post)
+        
+        sent_rows = []
+        with ThreadPoolExecutor(max_workers=min(POST_CONCURRENCY, len(by_chat))) as pool:
+            for chat_rows, chat_errors in pool.map(process_chat_posts, by_chat.values(), repeat(start_iso)):
+                sent_rows.extend(chat_rows)
+                errors.extend(chat_errors)
+        
+        record_sent_posts(sent_rows)
+        
+        failed = len(errors)
+        succeeded = len(posts) - failed
         
         end_time = datetime.now(timezone.utc)
         duration = (end_time - start_time).total_seconds() * 1000
         
-        print(f"\n{'='*60}")
-        print(f"Processing Completed")
-        print(f"Duration: {duration}ms")
-        print(f"✅ Succeeded: {succeeded}")
-        print(f"❌ Failed: {failed}")
-        print(f"{'='*60}\n")
+        logger.info(f"Processing completed in {duration:.0f}ms: ✅ {succeeded} succeeded, ❌ {failed} failed")
         
         return {
             'total_claimed': len(posts),
             'succeeded': succeeded,
             'failed': failed,
             'errors': errors,
-            'timestamp': start_time.isoformat()
+            'timestamp': start_iso
         }
         
     except Exception as e:
-        print(f"❌ Fatal error in process_jobs: {str(e)}")
+        logger.exception(f"❌ Fatal error in process_jobs: {e}")
         
         return {
             'total_claimed': 0,
             'succeeded': succeeded,
             'failed': failed,
             'errors': [str(e)] + errors,
-            'timestamp': start_time.isoformat()
+            'timestamp': start_iso
         }
 
 # ============================================
 # SCHEDULER LOOP
 # ============================================
 
-def scheduler_loop():
-    """Background loop checking execution times"""
-    global last_execution
+def next_run(after):
+    """First execution time (WEST) strictly after `after`"""
+    for day in (0, 1):
+        date = (after + timedelta(days=day)).date()
+        for t in SCHEDULE:
+            candidate = datetime.combine(date, t, tzinfo=WEST)
+            if candidate > after:
+                return candidate
+
+
+async def scheduler_task():
+    """Sleep until each execution time on the caller's event loop, then run
+    the (blocking) job pass in a worker thread"""
+    logger.info(f"🕐 Scheduler started for '{SERVICE_TYPE}' at {EXECUTION_TIMES}")
     
-    print(f"🕐 Scheduler started for '{SERVICE_TYPE}' at {EXECUTION_TIMES}")
+    # Starting inside an execution minute still runs that slot, as the old per-minute check did
+    after = datetime.now(WEST) - timedelta(minutes=1)
     
     while True:
         try:
-            now = datetime.now(WEST)
-            current_time = now.strftime("%H:%M")
-            execution_key = f"{now.strftime('%Y-%m-%d')}_{current_time}"
+            target = next_run(after)
+            logger.info(f"💤 Next execution at {target.isoformat()}")
             
-            if current_time in EXECUTION_TIMES and last_execution != execution_key:
-                print(f"\n⏰ Execution time reached ({current_time})")
-                last_execution = execution_key
-                process_jobs()
+            # Re-check after waking: a long sleep can end early or the clock can move
+            while (remaining := (target - datetime.now(WEST)).total_seconds()) > 0:
+                await asyncio.sleep(remaining)
             
-            time.sleep(60)
+            after = target
+            logger.info(f"⏰ Execution time reached ({target.strftime('%H:%M')})")
+            job = asyncio.ensure_future(asyncio.to_thread(process_jobs))
+            try:
+                await asyncio.shield(job)
+            except asyncio.CancelledError:
+                # The thread can't be interrupted; let the pass finish (and record
+                # what it sent) so a shutdown awaiting this task closes pools after it
+                await job
+                raise
             
+        except asyncio.CancelledError:
+            raise
         except Exception as e:
-            print(f"⚠️ Scheduler error: {str(e)}")
-            time.sleep(60)
-
+            logger.exception(f"⚠️ Scheduler error: {e}")
+            await asyncio.sleep(60)
 
-def start_scheduler():
-    """Start scheduler in background thread (non-blocking when imported)"""
-    thread = threading.Thread(target=scheduler_loop, daemon=True)
-    thread.start()
-    print(f"✅ Background scheduler thread started for '{SERVICE_TYPE}'")
 
 def start_scheduler_blocking():
-    """Start scheduler and keep main thread alive (for standalone mode)"""
-    start_scheduler()
-    
-    # Keep main thread alive
+    """Run the scheduler on its own event loop (for standalone mode)"""
     try:
-        print("🔄 Running in standalone mode - press Ctrl+C to stop")
-        while True:
-            time.sleep(1)
+        logger.info("🔄 Running in standalone mode - press Ctrl+C to stop")
+        asyncio.run(scheduler_task())
     except KeyboardInterrupt:
-        print("\n⚠️ Shutting down...")
+        logger.warning("⚠️ Shutting down...")
         exit(0)
 
 # ============================================